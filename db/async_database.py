@@ -0,0 +1,80 @@
+import asyncio
+import contextlib
+import functools
+import inspect
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator
+
+from database import DatabaseManager
+
+class AsyncDatabaseManager:
+    """Asyncio front-end exposing the DatabaseManager API as coroutines
+
+    Writes run on a single dedicated thread, so they never contend with each
+    other for SQLite's write lock, while reads fan out over a small pool of
+    reader threads. Each thread borrows its own pooled connection. Generator
+    methods become async generators that advance one step per executor call.
+    """
+    WRITE_METHODS = frozenset(DatabaseManager.WRITE_METHODS)
+
+    def __init__(self, db_path: str = "db/test.db", readers: int = 4, **kwargs: Any):
+        # One connection for the writer thread plus one per reader thread
+        self.db = DatabaseManager(db_path, pool_size=readers + 1, **kwargs)
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+        self._readers = ThreadPoolExecutor(max_workers=readers, thread_name_prefix="db-reader")
+
+    async def __aenter__(self) -> "AsyncDatabaseManager":
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback) -> None:
+        await self.close()
+
+    def __getattr__(self, name: str) -> Any:
+        if name == "db":
+            raise AttributeError(name)  # Not constructed yet; avoid recursing
+        attr = getattr(self.db, name)
+        if name.startswith("_") or not callable(attr):
+            return attr
+        executor = self._writer if name in self.WRITE_METHODS else self._readers
+        if inspect.isgeneratorfunction(getattr(type(self.db), name, None)):
+            return self._async_generator(attr, executor)
+
+        @functools.wraps(attr)
+        async def call(*args: Any, **kwargs: Any) -> Any:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(executor, functools.partial(attr, *args, **kwargs))
+
+        return call
+
+    @staticmethod
+    def _async_generator(method: Any, executor: ThreadPoolExecutor) -> Any:
+        """Wrap a generator method so each item is produced off-loop on executor"""
+        @functools.wraps(method)
+        async def iterate(*args: Any, **kwargs: Any) -> AsyncIterator[Any]:
+            loop = asyncio.get_running_loop()
+            iterator = method(*args, **kwargs)  # Runs nothing until the first next()
+            done = object()
+            step = None
+            try:
+                while True:
+                    step = loop.run_in_executor(executor, next, iterator, done)
+                    # Shielded so cancelling the consumer leaves the running step to finish
+                    item = await asyncio.shield(step)
+                    if item is done:
+                        return
+                    yield item
+            finally:
+                # A generator cannot be closed while next() is still executing it
+                if step is not None and not step.done():
+                    with contextlib.suppress(Exception):
+                        await asyncio.shield(step)
+                await loop.run_in_executor(executor, iterator.close)
+
+        return iterate
+
+    async def close(self) -> None:
+        """Wait for queued calls to finish, then close the pooled connections"""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._writer.shutdown)
+        await loop.run_in_executor(None, self._readers.shutdown)
+        self.db.close()
@@ -0,0 +1,242 @@
+import argparse
+import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from database import DatabaseManager
+
+# DatabaseManager keyword arguments for each configuration under test.
+# Pool size only matters under concurrency, which the concurrent_* results measure
+CONFIGS: Dict[str, Dict[str, Any]] = {
+    "durable": {"profile": "durable"},
+    "throughput": {"profile": "throughput"},
+    "throughput-pool1": {"profile": "throughput", "pool_size": 1},
+    "throughput-zlib": {"profile": "throughput", "compression": "zlib", "compression_threshold": 256},
+}
+
+DEFAULT_SCALES = (10 ** 3, 10 ** 4, 10 ** 5)
+DEFAULT_READERS = 4
+RETENTION_DAYS = 30
+HISTORY_DAYS = 60
+
+def percentile(samples: Sequence[float], fraction: float) -> float:
+    """Nearest-rank percentile of already sorted samples"""
+    if not samples:
+        return 0.0
+    index = min(len(samples) - 1, max(0, int(round(fraction * len(samples))) - 1))
+    return samples[index]
+
+def summarize(latencies: List[float], operations: Optional[int] = None) -> Dict[str, float]:
+    """Throughput and latency percentiles (ms) from per-call seconds"""
+    latencies = sorted(latencies)
+    total = sum(latencies)
+    operations = len(latencies) if operations is None else operations
+    return {
+        "calls": len(latencies),
+        "operations": operations,
+        "seconds": total,
+        "ops_per_sec": operations / total if total else 0.0,
+        "mean_ms": total / len(latencies) * 1000 if latencies else 0.0,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "max_ms": latencies[-1] * 1000 if latencies else 0.0,
+    }
+
+def timed(fn: Callable[[], Any], samples: int) -> List[float]:
+    """Call fn samples times and return each call's duration in seconds"""
+    latencies = []
+    for _ in range(samples):
+        started = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+def concurrent(db: DatabaseManager, agent_ids: List[str], samples: int, readers: int,
+               seed: int) -> Dict[str, Dict[str, float]]:
+    """Time reads from several threads while one more thread keeps storing messages
+
+    ops_per_sec is aggregate throughput over wall-clock time, so it shows
+    how well the pool serves threads at once rather than per-call speed.
+    """
+    read_latencies: List[List[float]] = [[] for _ in range(readers)]
+    write_latencies: List[float] = []
+    reading = threading.Event()
+    reading.set()
+
+    def read(latencies: List[float], rng: random.Random) -> None:
+        latencies.extend(timed(lambda: db.get_agent_messages(rng.choice(agent_ids), limit=10), samples))
+
+    def write(rng: random.Random) -> None:
+        while reading.is_set():
+            started = time.perf_counter()
+            db.store_message(rng.choice(agent_ids), rng.choice(agent_ids), "concurrent message")
+            write_latencies.append(time.perf_counter() - started)
+
+    threads = [threading.Thread(target=read, args=(latencies, random.Random(seed + i)))
+               for i, latencies in enumerate(read_latencies)]
+    writer = threading.Thread(target=write, args=(random.Random(seed - 1),))
+    started = time.perf_counter()
+    writer.start()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    reading.clear()
+    writer.join()
+    wall = time.perf_counter() - started
+
+    reads = [latency for latencies in read_latencies for latency in latencies]
+    return {
+        "concurrent_reads": {**summarize(reads), "seconds": wall, "ops_per_sec": len(reads) / wall,
+                             "threads": readers},
+        "concurrent_writes": {**summarize(write_latencies), "seconds": wall,
+                              "ops_per_sec": len(write_latencies) / wall, "threads": 1},
+    }
+
+def db_size(db_path: str) -> int:
+    """Size on disk of the database including its WAL and shared-memory files"""
+    return sum(os.path.getsize(db_path + suffix)
+               for suffix in ("", "-wal", "-shm") if os.path.exists(db_path + suffix))
+
+def populate(db: DatabaseManager, messages: int, agents: int, rng: random.Random,
+             chunk_size: int = 10000) -> None:
+    """Create synthetic agents and messages spread over HISTORY_DAYS"""
+    agent_ids = [f"agent-{i}" for i in range(agents)]
+    for agent_id in agent_ids:
+        db.create_agent(agent_id, "benchmark", "llama2")
+    words = ["agent", "model", "answer", "question", "context", "token", "memory", "search"]
+
+    def generate():
+        for i in range(messages):
+            text = " ".join(rng.choice(words) for _ in range(rng.randint(5, 60)))
+            yield (rng.choice(agent_ids), rng.choice(agent_ids), f"{i}: {text}")
+
+    db.store_messages(generate(), chunk_size=chunk_size)
+    # Spread messages evenly over the history in id order, as live appends
+    # would be, so cleanup has a realistic share of expired rows to purge
+    with db.get_connection() as conn:
+        conn.execute("""
+        UPDATE messages
+        SET timestamp = datetime('now', '-' || CAST((? - id) * ? AS INTEGER) || ' seconds')
+        """, (messages, HISTORY_DAYS * 86400 / max(messages, 1)))
+    now = time.time()
+    db.touch_agents({agent_id: now - rng.uniform(0, 7200) for agent_id in agent_ids})
+
+def run_benchmark(scale: int, config: str = "throughput", samples: int = 1000,
+                  workdir: Optional[str] = None, seed: int = 42,
+                  readers: int = DEFAULT_READERS) -> Dict[str, Any]:
+    """Populate a fresh database with scale messages and time each hot path"""
+    rng = random.Random(seed)
+    agents = max(10, min(10000, scale // 100))
+    workdir = workdir or tempfile.mkdtemp(prefix="noha-bench-")
+    db_path = os.path.join(workdir, f"bench-{config}-{scale}.db")
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+
+    result: Dict[str, Any] = {"scale": scale, "agents": agents, "config": config,
+                              "settings": CONFIGS[config], "samples": samples}
+    with DatabaseManager(db_path, **CONFIGS[config]) as db:
+        started = time.perf_counter()
+        populate(db, scale, agents, rng)
+        populate_seconds = time.perf_counter() - started
+        result["populate"] = {"seconds": populate_seconds, "rows_per_sec": scale / populate_seconds}
+        result["size_bytes"] = {"populated": db_size(db_path)}
+        agent_ids = [f"agent-{i}" for i in range(agents)]
+
+        benchmarks = result["benchmarks"] = {}
+        benchmarks["store_message"] = summarize(timed(
+            lambda: db.store_message(rng.choice(agent_ids), rng.choice(agent_ids), "benchmark message"),
+            samples))
+        benchmarks["get_agent_messages"] = summarize(timed(
+            lambda: db.get_agent_messages(rng.choice(agent_ids), limit=10), samples))
+        # Returns every recently active agent, so fewer samples are enough
+        benchmarks["get_active_agents"] = summarize(timed(
+            lambda: db.get_active_agents(minutes=60), max(1, samples // 10)))
+        benchmarks["update_agent_state"] = summarize(timed(
+            lambda: db.update_agent_state(rng.choice(agent_ids), {"step": rng.randint(0, 10 ** 6)}),
+            samples))
+        benchmarks.update(concurrent(db, agent_ids, samples, readers, seed))
+
+        chunk_latencies = []
+        deleted = 0
+        for stats in db.iter_cleanup_old_messages(RETENTION_DAYS, pause=0):
+            chunk_latencies.append(stats["seconds"])
+            deleted += stats["rows"]
+        benchmarks["cleanup_old_messages"] = {**summarize(chunk_latencies, deleted),
+                                              "rows_deleted": deleted}
+        result["size_bytes"]["after_cleanup"] = db_size(db_path)
+        result["statements"] = db.stats()["statements"]
+    return result
+
+def compare(previous: Dict[str, Any], current: Dict[str, Any]) -> List[str]:
+    """Describe ops/sec and p99 changes between two saved runs"""
+    lines = []
+    baseline = {(r["config"], r["scale"]): r for r in previous["results"]}
+    for run in current["results"]:
+        before = baseline.get((run["config"], run["scale"]))
+        if before is None:
+            continue
+        for name, now in run["benchmarks"].items():
+            old = before["benchmarks"].get(name)
+            if not old or not old["ops_per_sec"]:
+                continue
+            change = (now["ops_per_sec"] / old["ops_per_sec"] - 1) * 100
+            lines.append(f"{run['config']:>18} {run['scale']:>9} {name:<22} "
+                         f"{change:+7.1f}% ops/s  p99 {old['p99_ms']:.3f} -> {now['p99_ms']:.3f} ms")
+    return lines
+
+def main(argv: Optional[Sequence[str]] = None) -> Dict[str, Any]:
+    parser = argparse.ArgumentParser(description="Benchmark DatabaseManager hot paths")
+    parser.add_argument("--scales", type=lambda s: int(float(s)), nargs="+", default=list(DEFAULT_SCALES),
+                        help="message counts to test, e.g. 1e3 1e5 1e7")
+    parser.add_argument("--configs", nargs="+", choices=sorted(CONFIGS), default=sorted(CONFIGS))
+    parser.add_argument("--samples", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--readers", type=int, default=DEFAULT_READERS,
+                        help="reader threads in the concurrent benchmark")
+    parser.add_argument("--output", default=None, help="JSON results path")
+    parser.add_argument("--compare", default=None, help="previous JSON results to compare against")
+    parser.add_argument("--keep", action="store_true", help="keep the generated databases")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="noha-bench-")
+    report = {"started": datetime.now().isoformat(), "results": []}
+    try:
+        for scale in args.scales:
+            for config in args.configs:
+                print(f"Benchmarking {config} at {scale} messages...")
+                run = run_benchmark(scale, config, args.samples, workdir, args.seed, args.readers)
+                report["results"].append(run)
+                for name, stats in run["benchmarks"].items():
+                    print(f"  {name:<22} {stats['ops_per_sec']:>12.1f} ops/s  "
+                          f"p50 {stats['p50_ms']:.3f} ms  p99 {stats['p99_ms']:.3f} ms")
+                print(f"  size {run['size_bytes']['populated'] / 2 ** 20:.1f} MiB, "
+                      f"{run['size_bytes']['after_cleanup'] / 2 ** 20:.1f} MiB after cleanup")
+    finally:
+        if args.keep:
+            print(f"Databases kept in {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    output = args.output or os.path.join(
+        "db", "benchmarks", f"results-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as handle:
+        json.dump(report, handle, indent=2)
+    print(f"Results saved to {output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as handle:
+            for line in compare(json.load(handle), report):
+                print(line)
+    return report
+
+if __name__ == "__main__":
+    main()
@@ -1,123 +1,1368 @@
 import sqlite3
-from datetime import datetime
-from typing import Dict, List, Optional, Any
+import threading
+import time
+from bisect import bisect_left
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from queue import Queue, Empty, Full
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, Any, Sequence, Tuple, Union
+import csv
 import json
+import lzma
+import re
+import zlib
 
-class DatabaseManager:
-    def __init__(self, db_path: str = "db/test.db"):
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet export falls back to CSV without pyarrow
+    pa = None
+    pq = None
+
+# Pragma presets applied to every pooled connection when it is opened.
+# "durable" keeps full fsync on commit, "throughput" trades the last few
+# commits on power loss for much cheaper writes, and "ephemeral-test" skips
+# durability entirely for throwaway databases.
+PRAGMA_PROFILES: Dict[str, Dict[str, Any]] = {
+    "durable": {
+        "auto_vacuum": "INCREMENTAL",  # Only takes effect on new databases
+        "journal_mode": "WAL",
+        "synchronous": "FULL",
+        "cache_size": -16000,  # KiB
+        "mmap_size": 67108864,
+        "temp_store": "MEMORY",
+        "busy_timeout": 5000,
+    },
+    "throughput": {
+        "auto_vacuum": "INCREMENTAL",  # Only takes effect on new databases
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -65536,  # KiB
+        "mmap_size": 268435456,
+        "temp_store": "MEMORY",
+        "busy_timeout": 5000,
+    },
+    "ephemeral-test": {
+        "journal_mode": "MEMORY",
+        "synchronous": "OFF",
+        "cache_size": -8000,  # KiB
+        "mmap_size": 0,
+        "temp_store": "MEMORY",
+        "busy_timeout": 1000,
+    },
+}
+
+def resolve_pragmas(profile: str = "throughput",
+                    overrides: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Return the pragmas for a named profile with any overrides applied"""
+    if profile not in PRAGMA_PROFILES:
+        raise ValueError(f"Unknown pragma profile '{profile}', expected one of {sorted(PRAGMA_PROFILES)}")
+    pragmas = dict(PRAGMA_PROFILES[profile])
+    pragmas.update(overrides or {})
+    return pragmas
+
+def resolve(value: Any) -> Any:
+    """Wait for a Future's result; other values are returned as they are
+
+    Lets helpers that wrap a DatabaseManager also accept a
+    SerializedDatabaseManager, whose write methods return Futures.
+    """
+    return value.result() if isinstance(value, Future) else value
+
+# Codecs for transparent compression of message content and agent state.
+# Each row records the codec name next to the value; NULL means uncompressed.
+CODECS: Dict[str, Tuple[Any, Any]] = {
+    "zlib": (zlib.compress, zlib.decompress),
+    "lzma": (lzma.compress, lzma.decompress),
+}
+
+def decompress_value(codec: Optional[str], value: Any) -> Any:
+    """Return the text stored under codec; also registered in SQL as noha_decompress"""
+    if codec is None or value is None:
+        return value
+    return CODECS[codec][1](value).decode("utf-8")
+
+_WORD = re.compile(r"\w+")
+_QUERY_TERM = re.compile(r"(\w+)(\*?)")
+_QUERY_OPERATORS = {"AND", "OR", "NOT", "NEAR"}
+
+def make_snippet(text: str, query: str, tokens: int = 12) -> str:
+    """Window of up to tokens words of text with the most query matches, matches in [brackets]
+
+    Stands in for FTS5's snippet(), which needs the indexed text and so
+    returns nothing on the contentless messages_fts table.
+    """
+    terms = [(term.lower(), bool(star)) for term, star in _QUERY_TERM.findall(query)
+             if term not in _QUERY_OPERATORS]
+    words = list(_WORD.finditer(text))
+    matched = [any(word.group().lower().startswith(term) if prefix else word.group().lower() == term
+                   for term, prefix in terms) for word in words]
+    if not words:
+        return text
+    start = max(range(max(len(words) - tokens, 0) + 1), key=lambda i: (sum(matched[i:i + tokens]), -i))
+    end = min(start + tokens, len(words))
+    # Text before the first word and after the last is kept when the window reaches it
+    parts = ["..." if start > 0 else ""]
+    position = words[start].start() if start > 0 else 0
+    for word, hit in zip(words[start:end], matched[start:end]):
+        parts.append(text[position:word.start()])
+        parts.append(f"[{word.group()}]" if hit else word.group())
+        position = word.end()
+    parts.append("..." if end < len(words) else text[position:])
+    return "".join(parts)
+
+# Ordered schema migrations as (version, statements). The applied version is
+# tracked in PRAGMA user_version; append new entries, never edit old ones.
+MIGRATIONS: List[Tuple[int, List[str]]] = [
+    (1, [
+        """
+        CREATE TABLE IF NOT EXISTS agents (
+            agent_id TEXT PRIMARY KEY,
+            agent_type TEXT NOT NULL,
+            model TEXT NOT NULL,
+            state TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            last_active DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            sender_id TEXT NOT NULL,
+            receiver_id TEXT NOT NULL,
+            content TEXT NOT NULL,
+            message_type TEXT DEFAULT 'general',
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            processed BOOLEAN DEFAULT FALSE
+        )
+        """,
+    ]),
+    (2, [
+        "CREATE INDEX IF NOT EXISTS idx_messages_receiver_ts ON messages (receiver_id, timestamp)",
+        "CREATE INDEX IF NOT EXISTS idx_messages_sender_ts ON messages (sender_id, timestamp)",
+        "CREATE INDEX IF NOT EXISTS idx_messages_processed_ts ON messages (processed, timestamp)",
+        "CREATE INDEX IF NOT EXISTS idx_agents_last_active ON agents (last_active)",
+    ]),
+    (3, [
+        # Unix time until which a worker holds a claimed message
+        "ALTER TABLE messages ADD COLUMN lease_expires_at REAL",
+        """
+        CREATE INDEX IF NOT EXISTS idx_messages_unprocessed
+        ON messages (receiver_id, timestamp) WHERE processed = FALSE
+        """,
+    ]),
+    (4, [
+        # Bumped on every state write; used for compare-and-swap patches
+        "ALTER TABLE agents ADD COLUMN version INTEGER NOT NULL DEFAULT 0",
+    ]),
+    (5, [
+        # External-content FTS index: stores only the index, reads text from messages
+        """
+        CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+            content, content='messages', content_rowid='id'
+        )
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+            INSERT INTO messages_fts (rowid, content) VALUES (new.id, new.content);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+            INSERT INTO messages_fts (messages_fts, rowid, content)
+            VALUES ('delete', old.id, old.content);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE OF content ON messages BEGIN
+            INSERT INTO messages_fts (messages_fts, rowid, content)
+            VALUES ('delete', old.id, old.content);
+            INSERT INTO messages_fts (rowid, content) VALUES (new.id, new.content);
+        END
+        """,
+        "INSERT INTO messages_fts (messages_fts) VALUES ('rebuild')",
+    ]),
+    (6, [
+        "ALTER TABLE messages ADD COLUMN codec TEXT",
+        "ALTER TABLE agents ADD COLUMN state_codec TEXT",
+        # The FTS index must see plain text, so it now reads from a view that
+        # decompresses content, and the triggers index decompressed values
+        "DROP TRIGGER IF EXISTS messages_fts_insert",
+        "DROP TRIGGER IF EXISTS messages_fts_delete",
+        "DROP TRIGGER IF EXISTS messages_fts_update",
+        "DROP TABLE IF EXISTS messages_fts",
+        """
+        CREATE VIEW IF NOT EXISTS messages_fts_source AS
+        SELECT id, noha_decompress(codec, content) AS content FROM messages
+        """,
+        """
+        CREATE VIRTUAL TABLE messages_fts USING fts5(
+            content, content='messages_fts_source', content_rowid='id'
+        )
+        """,
+        """
+        CREATE TRIGGER messages_fts_insert AFTER INSERT ON messages BEGIN
+            INSERT INTO messages_fts (rowid, content)
+            VALUES (new.id, noha_decompress(new.codec, new.content));
+        END
+        """,
+        """
+        CREATE TRIGGER messages_fts_delete AFTER DELETE ON messages BEGIN
+            INSERT INTO messages_fts (messages_fts, rowid, content)
+            VALUES ('delete', old.id, noha_decompress(old.codec, old.content));
+        END
+        """,
+        """
+        CREATE TRIGGER messages_fts_update AFTER UPDATE OF content, codec ON messages BEGIN
+            INSERT INTO messages_fts (messages_fts, rowid, content)
+            VALUES ('delete', old.id, noha_decompress(old.codec, old.content));
+            INSERT INTO messages_fts (rowid, content)
+            VALUES (new.id, noha_decompress(new.codec, new.content));
+        END
+        """,
+        "INSERT INTO messages_fts (messages_fts) VALUES ('rebuild')",
+    ]),
+    (7, [
+        # Retention cleanup finds expired rows by timestamp, whatever their id
+        "CREATE INDEX IF NOT EXISTS idx_messages_timestamp ON messages (timestamp)",
+    ]),
+    (8, [
+        # The schema must not depend on noha_decompress, which only exists on
+        # connections opened by DatabaseManager, and triggers that write to a
+        # virtual table are refused under trusted_schema=OFF. The FTS table
+        # now keeps its own plain-text copy and DatabaseManager maintains it;
+        # rows written by other tools are picked up by a rebuild.
+        "DROP TRIGGER IF EXISTS messages_fts_insert",
+        "DROP TRIGGER IF EXISTS messages_fts_delete",
+        "DROP TRIGGER IF EXISTS messages_fts_update",
+        "DROP TABLE IF EXISTS messages_fts",
+        "DROP VIEW IF EXISTS messages_fts_source",
+        "CREATE VIRTUAL TABLE messages_fts USING fts5(content)",
+        "INSERT INTO messages_fts (rowid, content) SELECT id, noha_decompress(codec, content) FROM messages",
+    ]),
+    (9, [
+        # A contentless index stores only the inverted index, not a second,
+        # uncompressed copy of every message. DatabaseManager deletes entries
+        # with the decompressed text they were indexed under and builds
+        # snippets from the message row.
+        "DROP TABLE IF EXISTS messages_fts",
+        "CREATE VIRTUAL TABLE messages_fts USING fts5(content, content='')",
+        "INSERT INTO messages_fts (rowid, content) SELECT id, noha_decompress(codec, content) FROM messages",
+    ]),
+]
+
+# Named statements used by DatabaseManager. Running the exact same SQL text
+# each time lets every connection's statement cache reuse the prepared
+# statement, and the name keys the per-statement timings in stats().
+STATEMENTS: Dict[str, str] = {
+    "create_agent": """
+        INSERT INTO agents (agent_id, agent_type, model)
+        VALUES (?, ?, ?)
+    """,
+    "get_agent": "SELECT * FROM agents WHERE agent_id = ?",
+    "update_agent_state": """
+        UPDATE agents 
+        SET state = ?, state_codec = ?, version = version + 1
+        WHERE agent_id = ?
+    """,
+    "patch_agent_state": """
+        UPDATE agents
+        SET state = json_patch(COALESCE(noha_decompress(state_codec, state), '{}'), ?),
+            state_codec = NULL, version = version + 1
+        WHERE agent_id = ?
+        RETURNING version
+    """,
+    "patch_agent_state_cas": """
+        UPDATE agents
+        SET state = json_patch(COALESCE(noha_decompress(state_codec, state), '{}'), ?),
+            state_codec = NULL, version = version + 1
+        WHERE agent_id = ? AND version = ?
+        RETURNING version
+    """,
+    "get_agent_version": "SELECT version FROM agents WHERE agent_id = ?",
+    "store_message": """
+        INSERT INTO messages (sender_id, receiver_id, content, codec, message_type)
+        VALUES (?, ?, ?, ?, ?)
+    """,
+    "last_insert_rowid": "SELECT last_insert_rowid()",
+    "index_message": "INSERT INTO messages_fts (rowid, content) VALUES (?, ?)",
+    # A contentless index can only drop a row given the exact text it indexed
+    "unindex_message": "INSERT INTO messages_fts (messages_fts, rowid, content) VALUES ('delete', ?, ?)",
+    # Each branch walks its own (agent, timestamp) index backwards and stops
+    # after `limit` rows; UNION merges them and drops self-addressed duplicates
+    "get_agent_messages": """
+        SELECT * FROM (
+            SELECT * FROM messages WHERE sender_id = ?
+            ORDER BY timestamp DESC, id DESC LIMIT ?
+        )
+        UNION
+        SELECT * FROM (
+            SELECT * FROM messages WHERE receiver_id = ?
+            ORDER BY timestamp DESC, id DESC LIMIT ?
+        )
+        ORDER BY timestamp DESC, id DESC
+        LIMIT ?
+    """,
+    "message_page": """
+        SELECT * FROM (
+            SELECT * FROM messages
+            WHERE sender_id = ? AND (timestamp, id) > (?, ?)
+            ORDER BY timestamp, id LIMIT ?
+        )
+        UNION
+        SELECT * FROM (
+            SELECT * FROM messages
+            WHERE receiver_id = ? AND (timestamp, id) > (?, ?)
+            ORDER BY timestamp, id LIMIT ?
+        )
+        ORDER BY timestamp, id
+        LIMIT ?
+    """,
+    "message_page_before": """
+        SELECT * FROM (
+            SELECT * FROM messages
+            WHERE sender_id = ? AND (timestamp, id) > (?, ?) AND timestamp < ?
+            ORDER BY timestamp, id LIMIT ?
+        )
+        UNION
+        SELECT * FROM (
+            SELECT * FROM messages
+            WHERE receiver_id = ? AND (timestamp, id) > (?, ?) AND timestamp < ?
+            ORDER BY timestamp, id LIMIT ?
+        )
+        ORDER BY timestamp, id
+        LIMIT ?
+    """,
+    "search_messages": """
+        SELECT m.*, bm25(messages_fts) AS rank
+        FROM messages_fts
+        JOIN messages m ON m.id = messages_fts.rowid
+        WHERE messages_fts MATCH ?
+        ORDER BY rank
+        LIMIT ? OFFSET ?
+    """,
+    "search_agent_messages": """
+        SELECT m.*, bm25(messages_fts) AS rank
+        FROM messages_fts
+        JOIN messages m ON m.id = messages_fts.rowid
+        WHERE messages_fts MATCH ? AND (m.sender_id = ? OR m.receiver_id = ?)
+        ORDER BY rank
+        LIMIT ? OFFSET ?
+    """,
+    "clear_search_index": "INSERT INTO messages_fts (messages_fts) VALUES ('delete-all')",
+    "rebuild_search_index": """
+        INSERT INTO messages_fts (rowid, content)
+        SELECT id, noha_decompress(codec, content) FROM messages
+    """,
+    "optimize_search_index": "INSERT INTO messages_fts (messages_fts) VALUES ('optimize')",
+    "mark_message_processed": "UPDATE messages SET processed = TRUE, lease_expires_at = NULL WHERE id = ?",
+    "claim_messages": """
+        UPDATE messages
+        SET lease_expires_at = ?
+        WHERE id IN (
+            SELECT id FROM messages
+            WHERE receiver_id = ? AND processed = FALSE
+              AND (lease_expires_at IS NULL OR lease_expires_at <= ?)
+            ORDER BY timestamp, id
+            LIMIT ?
+        )
+        RETURNING *
+    """,
+    "release_messages": "UPDATE messages SET lease_expires_at = NULL WHERE id = ? AND processed = FALSE",
+    "get_active_agents": """
+        SELECT * FROM agents 
+        WHERE last_active >= datetime('now', ? || ' minutes')
+        ORDER BY last_active DESC
+    """,
+    "touch_agents": """
+        UPDATE agents
+        SET last_active = ?
+        WHERE agent_id = ? AND (last_active IS NULL OR last_active < ?)
+    """,
+    "cleanup_cutoff": "SELECT datetime('now', ? || ' days')",
+    "cleanup_delete_chunk": """
+        DELETE FROM messages WHERE id IN (
+            SELECT id FROM messages WHERE timestamp < ? ORDER BY timestamp, id LIMIT ?
+        )
+        RETURNING id, codec, content
+    """,
+}
+
+# Upper bounds (milliseconds) of the per-statement latency histogram buckets
+LATENCY_BUCKETS_MS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+class QueryStats:
+    """Thread-safe per-statement latency histograms, counters and slow-query log"""
+    def __init__(self, slow_query_ms: float = 100.0, slow_log_size: int = 100):
+        self.slow_query_ms = slow_query_ms
+        self._statements: Dict[str, Dict[str, Any]] = {}
+        self._slow_log: deque = deque(maxlen=slow_log_size)
+        self._lock = threading.Lock()
+
+    def record(self, name: str, seconds: float, rows: int, error: bool = False) -> None:
+        """Count one execution of a named statement"""
+        elapsed_ms = seconds * 1000
+        with self._lock:
+            entry = self._statements.get(name)
+            if entry is None:
+                entry = self._statements[name] = {
+                    "calls": 0, "errors": 0, "rows": 0, "total_ms": 0.0, "max_ms": 0.0,
+                    # One slot per bucket plus an overflow slot
+                    "histogram": [0] * (len(LATENCY_BUCKETS_MS) + 1),
+                }
+            entry["calls"] += 1
+            entry["rows"] += rows
+            entry["total_ms"] += elapsed_ms
+            entry["max_ms"] = max(entry["max_ms"], elapsed_ms)
+            if error:
+                entry["errors"] += 1
+            entry["histogram"][bisect_left(LATENCY_BUCKETS_MS, elapsed_ms)] += 1
+
+    def is_slow(self, seconds: float) -> bool:
+        return seconds * 1000 >= self.slow_query_ms
+
+    def log_slow(self, entry: Dict[str, Any]) -> None:
+        with self._lock:
+            self._slow_log.append(entry)
+
+    @staticmethod
+    def _percentile(histogram: List[int], calls: int, fraction: float) -> float:
+        """Upper bound of the bucket containing the given fraction of calls"""
+        threshold = fraction * calls
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS_MS + (float("inf"),), histogram):
+            seen += count
+            if seen >= threshold:
+                return bound
+        return float("inf")
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Copy of all counters with mean/p50/p99 derived from the histograms"""
+        with self._lock:
+            statements = {}
+            for name, entry in self._statements.items():
+                calls = entry["calls"]
+                statements[name] = {
+                    **entry,
+                    "histogram": dict(zip([str(b) for b in LATENCY_BUCKETS_MS] + ["inf"],
+                                          entry["histogram"])),
+                    "mean_ms": entry["total_ms"] / calls if calls else 0.0,
+                    "p50_ms": self._percentile(entry["histogram"], calls, 0.5),
+                    "p99_ms": self._percentile(entry["histogram"], calls, 0.99),
+                }
+            return {"statements": statements, "slow_queries": list(self._slow_log)}
+
+    def reset(self) -> None:
+        with self._lock:
+            self._statements.clear()
+            self._slow_log.clear()
+
+def apply_migrations(conn: sqlite3.Connection, target: Optional[int] = None) -> int:
+    """Apply pending MIGRATIONS up to target (default: latest) on conn, one transaction each"""
+    for version, statements in MIGRATIONS:
+        if target is not None and version > target:
+            break
+        with conn:
+            # Take the write lock before reading the version so that
+            # concurrent processes cannot apply the same step twice
+            conn.execute("BEGIN IMMEDIATE")
+            if conn.execute("PRAGMA user_version").fetchone()[0] >= version:
+                continue
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {version}")
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+class PoolClosedError(sqlite3.Error):
+    """Raised when a connection is requested from a closed pool"""
+    pass
+
+class PoolTimeoutError(sqlite3.Error):
+    """Raised when no pooled connection becomes available in time"""
+    pass
+
+class VersionConflictError(Exception):
+    """Raised when an agent's state changed since the version a patch expected"""
+    def __init__(self, agent_id: str, expected_version: int, current_version: int):
+        super().__init__(
+            f"Agent {agent_id} is at version {current_version}, expected {expected_version}"
+        )
+        self.agent_id = agent_id
+        self.expected_version = expected_version
+        self.current_version = current_version
+
+class ConnectionPool:
+    """Fixed-size pool of long-lived SQLite connections with checkout/return semantics"""
+    def __init__(self, db_path: str, size: int = 5, timeout: float = 30.0,
+                 cached_statements: int = 256, pragmas: Optional[Dict[str, Any]] = None):
+        if size < 1:
+            raise ValueError("Pool size must be at least 1")
         self.db_path = db_path
-        
-    def get_connection(self) -> sqlite3.Connection:
-        """Create a database connection with proper settings"""
-        conn = sqlite3.connect(self.db_path)
+        self.size = size
+        self.timeout = timeout
+        self.cached_statements = cached_statements
+        self.pragmas = dict(pragmas or {})
+        self._idle: Queue = Queue(maxsize=size)
+        self._lock = threading.Lock()
+        self._created = 0
+        self._closed = False
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open a new connection; the pool hands it between threads itself"""
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self.timeout,
+            check_same_thread=False,
+            cached_statements=self.cached_statements
+        )
         conn.row_factory = sqlite3.Row  # Allows accessing columns by name
+        conn.create_function("noha_decompress", 2, decompress_value, deterministic=True)
+        try:
+            for name, value in self.pragmas.items():
+                conn.execute(f"PRAGMA {name} = {value}").fetchall()
+        except sqlite3.Error:
+            conn.close()
+            raise
         return conn
 
-    def _execute_query(self, query: str, parameters: tuple = ()) -> Optional[sqlite3.Cursor]:
-        """Execute a query and handle errors"""
+    @staticmethod
+    def _is_healthy(conn: sqlite3.Connection) -> bool:
+        """Check that an idle connection is still usable"""
         try:
-            with self.get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute(query, parameters)
-                return cursor
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def _discard(self, conn: sqlite3.Connection) -> None:
+        """Close a connection and free its slot in the pool"""
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        with self._lock:
+            self._created -= 1
+
+    def acquire(self) -> sqlite3.Connection:
+        """Check out a healthy connection, opening one if the pool has room"""
+        if self._closed:
+            raise PoolClosedError("Connection pool is closed")
+        try:
+            conn = self._idle.get_nowait()
+        except Empty:
+            with self._lock:
+                can_create = self._created < self.size
+                if can_create:
+                    self._created += 1
+            if can_create:
+                try:
+                    return self._connect()
+                except sqlite3.Error:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            try:
+                conn = self._idle.get(timeout=self.timeout)
+            except Empty:
+                raise PoolTimeoutError(
+                    f"No connection available after {self.timeout}s (pool size {self.size})"
+                )
+        if not self._is_healthy(conn):
+            self._discard(conn)
+            return self.acquire()
+        return conn
+
+    def release(self, conn: sqlite3.Connection) -> None:
+        """Return a connection to the pool, rolling back anything left open"""
+        if self._closed:
+            self._discard(conn)
+            return
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put_nowait(conn)
+        except (sqlite3.Error, Full):
+            self._discard(conn)
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """Borrow a connection for the duration of a with-block"""
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close(self) -> None:
+        """Close every idle connection; checked-out ones are closed on release"""
+        self._closed = True
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except Empty:
+                break
+            self._discard(conn)
+
+    def stats(self) -> Dict[str, int]:
+        """Return the pool's current size and idle connection count"""
+        return {"size": self.size, "open": self._created, "idle": self._idle.qsize()}
+
+class AgentCache:
+    """Thread-safe LRU cache of agent rows with a time-to-live and hit/miss counters"""
+    def __init__(self, max_size: int = 1024, ttl: Optional[float] = 30.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._rows: "OrderedDict[str, Tuple[float, Dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def generation(self) -> int:
+        """Return a token to pass to put(); it changes whenever anything is invalidated"""
+        return self._generation
+
+    def get(self, agent_id: str) -> Optional[Dict]:
+        """Return a copy of the cached row, or None on a miss or expired entry"""
+        with self._lock:
+            entry = self._rows.get(agent_id)
+            if entry is not None:
+                expires, row = entry
+                if self.ttl is None or expires > time.monotonic():
+                    self._rows.move_to_end(agent_id)
+                    self.hits += 1
+                    return dict(row)
+                del self._rows[agent_id]
+            self.misses += 1
+            return None
+
+    def put(self, agent_id: str, row: Dict, generation: int) -> None:
+        """Cache a row read from the database unless it was invalidated meanwhile"""
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            # A write that landed between the read and now may have made the row stale
+            if generation != self._generation:
+                return
+            expires = time.monotonic() + self.ttl if self.ttl is not None else 0.0
+            self._rows[agent_id] = (expires, dict(row))
+            self._rows.move_to_end(agent_id)
+            while len(self._rows) > self.max_size:
+                self._rows.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, *agent_ids: str) -> None:
+        """Drop the given agents from the cache"""
+        with self._lock:
+            self._generation += 1
+            for agent_id in agent_ids:
+                self._rows.pop(agent_id, None)
+
+    def clear(self) -> None:
+        """Drop every cached row"""
+        with self._lock:
+            self._generation += 1
+            self._rows.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return size and hit/miss counters"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._rows),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+class DatabaseManager:
+    # Methods that write to the database. Front-ends that funnel writes
+    # through one thread (AsyncDatabaseManager, SerializedDatabaseManager)
+    # route these and only these to it.
+    WRITE_METHODS = (
+        "migrate",
+        "create_agent",
+        "update_agent_state",
+        "update_agent_states",
+        "patch_agent_state",
+        "touch_agents",
+        "optimize_search_index",
+        "store_message",
+        "store_messages",
+        "mark_message_processed",
+        "claim_messages",
+        "ack_messages",
+        "release_messages",
+        "cleanup_old_messages",
+        "iter_cleanup_old_messages",
+    )
+
+    def __init__(self, db_path: str = "db/test.db", pool_size: int = 5,
+                 pool_timeout: float = 30.0, profile: str = "throughput",
+                 pragmas: Optional[Dict[str, Any]] = None, auto_migrate: bool = True,
+                 agent_cache_size: int = 1024, agent_cache_ttl: Optional[float] = 30.0,
+                 compression: Optional[str] = None, compression_threshold: int = 1024,
+                 slow_query_ms: float = 100.0):
+        if compression is not None and compression not in CODECS:
+            raise ValueError(f"Unknown codec '{compression}', expected one of {sorted(CODECS)}")
+        self.db_path = db_path
+        self.compression = compression
+        self.compression_threshold = compression_threshold
+        self.profile = profile
+        self.pragmas = resolve_pragmas(profile, pragmas)
+        self.pool = ConnectionPool(db_path, size=pool_size, timeout=pool_timeout,
+                                   pragmas=self.pragmas)
+        self.agent_cache = AgentCache(agent_cache_size, agent_cache_ttl)
+        self.query_stats = QueryStats(slow_query_ms)
+        if auto_migrate:
+            self.migrate()
+
+    def __enter__(self) -> "DatabaseManager":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Close all pooled connections"""
+        self.pool.close()
+
+    def schema_version(self) -> int:
+        """Return the schema version recorded in the database file"""
+        with self.pool.connection() as conn:
+            return conn.execute("PRAGMA user_version").fetchone()[0]
+
+    def migrate(self, target: Optional[int] = None) -> int:
+        """Apply pending migrations up to target (default: latest) and return the new version"""
+        with self.pool.connection() as conn:
+            return apply_migrations(conn, target)
+
+    @contextmanager
+    def get_connection(self, immediate: bool = False) -> Iterator[sqlite3.Connection]:
+        """Borrow a pooled connection, committing on success and rolling back on error
+
+        immediate=True takes the write lock up front with BEGIN IMMEDIATE.
+        """
+        with self.pool.connection() as conn:
+            with conn:
+                if immediate:
+                    conn.execute("BEGIN IMMEDIATE")
+                yield conn
+
+    def _encode(self, text: str) -> Tuple[Any, Optional[str]]:
+        """Compress text above the size threshold, returning (value, codec)"""
+        if self.compression is None or text is None:
+            return text, None
+        data = text.encode("utf-8")
+        if len(data) < self.compression_threshold:
+            return text, None
+        compressed = CODECS[self.compression][0](data)
+        if len(compressed) >= len(data):
+            return text, None
+        return compressed, self.compression
+
+    @staticmethod
+    def _decode_row(row: sqlite3.Row) -> Dict:
+        """Convert a row to a dict, decompressing content/state and dropping codec markers"""
+        result = dict(row)
+        if "codec" in result:
+            result["content"] = decompress_value(result.pop("codec"), result.get("content"))
+        if "state_codec" in result:
+            result["state"] = decompress_value(result.pop("state_codec"), result.get("state"))
+        return result
+
+    def _execute(self, conn: Any, name: str, parameters: Any = (), sql: Optional[str] = None,
+                 many: bool = False, fetch: Union[None, str, int] = None) -> Any:
+        """Run a named statement on a connection or cursor and record its timing
+
+        sql defaults to STATEMENTS[name]; pass it for statements built at
+        runtime. fetch is None (return the cursor), "one", "all" or a row
+        count for fetchmany, so that fetch time counts towards the latency.
+        """
+        sql = sql or STATEMENTS[name]
+        started = time.perf_counter()
+        try:
+            if many:
+                result = conn.executemany(sql, parameters)
+                rows = result.rowcount
+            else:
+                cursor = conn.execute(sql, parameters)
+                if fetch == "one":
+                    result = cursor.fetchone()
+                    rows = int(result is not None)
+                elif fetch == "all":
+                    result = cursor.fetchall()
+                    rows = len(result)
+                elif isinstance(fetch, int):
+                    result = cursor.fetchmany(fetch)
+                    rows = len(result)
+                else:
+                    result = cursor
+                    rows = max(cursor.rowcount, 0)
+        except sqlite3.Error:
+            self.query_stats.record(name, time.perf_counter() - started, 0, error=True)
+            raise
+        elapsed = time.perf_counter() - started
+        self.query_stats.record(name, elapsed, rows)
+        if self.query_stats.is_slow(elapsed):
+            self._log_slow_query(conn, name, sql, parameters[0] if many and parameters else parameters,
+                                 elapsed, rows)
+        return result
+
+    def _log_slow_query(self, conn: Any, name: str, sql: str, parameters: Any,
+                        elapsed: float, rows: int) -> None:
+        """Add a slow statement and its EXPLAIN QUERY PLAN to the slow-query log"""
+        try:
+            plan = [row[-1] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", parameters)]
+        except sqlite3.Error as e:
+            plan = [f"unavailable: {e}"]
+        self.query_stats.log_slow({
+            "name": name,
+            "ms": elapsed * 1000,
+            "rows": rows,
+            "sql": " ".join(sql.split()),
+            "plan": plan,
+            "at": datetime.now().isoformat(),
+        })
+
+    def stats(self) -> Dict[str, Any]:
+        """Per-statement latency histograms and counters, slow queries, pool and cache stats"""
+        return {
+            **self.query_stats.snapshot(),
+            "pool": self.pool.stats(),
+            "agent_cache": self.agent_cache.stats(),
+        }
+
+    def _fetch_one(self, name: str, parameters: tuple = (), sql: Optional[str] = None) -> Optional[Dict]:
+        """Run a named query and return its first row as a dict"""
+        try:
+            with self.pool.connection() as conn:
+                row = self._execute(conn, name, parameters, sql=sql, fetch="one")
+                return self._decode_row(row) if row else None
         except sqlite3.Error as e:
             print(f"Database error: {e}")
             return None
+
+    def _fetch_all(self, name: str, parameters: tuple = (), sql: Optional[str] = None) -> List[Dict]:
+        """Run a named query and return all rows as dicts"""
+        try:
+            with self.pool.connection() as conn:
+                rows = self._execute(conn, name, parameters, sql=sql, fetch="all")
+                return [self._decode_row(row) for row in rows]
+        except sqlite3.Error as e:
+            print(f"Database error: {e}")
+            return []
+
     def create_agent(self, agent_id: str, agent_type: str, model: str) -> bool:
         """Create a new agent in the database"""
-        query = """
-        INSERT INTO agents (agent_id, agent_type, model)
-        VALUES (?, ?, ?)
-        """
         try:
             with self.get_connection() as conn:
-                conn.execute(query, (agent_id, agent_type, model))
-                return True
+                self._execute(conn, "create_agent", (agent_id, agent_type, model))
+            self.agent_cache.invalidate(agent_id)
+            return True
         except sqlite3.Error as e:
             print(f"Error creating agent: {e}")
             return False
 
     def get_agent(self, agent_id: str) -> Optional[Dict]:
         """Find an agent by their ID"""
-        query = "SELECT * FROM agents WHERE agent_id = ?"
-        cursor = self._execute_query(query, (agent_id,))
-        if cursor:
-            result = cursor.fetchone()
-            return dict(result) if result else None
-        return None
+        cached = self.agent_cache.get(agent_id)
+        if cached is not None:
+            return cached
+        generation = self.agent_cache.generation()
+        agent = self._fetch_one("get_agent", (agent_id,))
+        if agent is not None:
+            self.agent_cache.put(agent_id, agent, generation)
+        return agent
+
     def update_agent_state(self, agent_id: str, state: Dict) -> bool:
         """Update an agent's state"""
-        query = """
-        UPDATE agents 
-        SET state = ?
-        WHERE agent_id = ?
-        """
         try:
             with self.get_connection() as conn:
-                conn.execute(query, (json.dumps(state), agent_id))
-                return True
+                self._execute(conn, "update_agent_state", (*self._encode(json.dumps(state)), agent_id))
+            self.agent_cache.invalidate(agent_id)
+            return True
         except sqlite3.Error as e:
             print(f"Error updating agent state: {e}")
             return False
 
+    def update_agent_states(self, states: Dict[str, Dict]) -> bool:
+        """Update several agents' states in a single transaction"""
+        try:
+            with self.get_connection() as conn:
+                self._execute(conn, "update_agent_state",
+                              [(*self._encode(json.dumps(state)), agent_id)
+                               for agent_id, state in states.items()], many=True)
+            self.agent_cache.invalidate(*states)
+            return True
+        except sqlite3.Error as e:
+            print(f"Error updating agent states: {e}")
+            return False
+
+    def patch_agent_state(self, agent_id: str, patch: Dict,
+                          expected_version: Optional[int] = None) -> Optional[int]:
+        """Merge a JSON patch into an agent's state and return the new version
+
+        The patch follows JSON merge-patch rules (RFC 7396): keys are set,
+        nested objects are merged and null values remove keys. It is applied
+        inside SQLite with json_patch, so only the patch is serialised here;
+        a compressed state is stored uncompressed again after patching.
+        With expected_version the update is a compare-and-swap and raises
+        VersionConflictError if another writer got there first. Returns None
+        if the agent does not exist or the update failed.
+        """
+        name = "patch_agent_state"
+        params: Tuple[Any, ...] = (json.dumps(patch), agent_id)
+        if expected_version is not None:
+            name = "patch_agent_state_cas"
+            params += (expected_version,)
+        try:
+            with self.get_connection() as conn:
+                row = self._execute(conn, name, params, fetch="one")
+                current = None
+                if row is None:
+                    current = self._execute(conn, "get_agent_version", (agent_id,), fetch="one")
+        except sqlite3.Error as e:
+            print(f"Error patching agent state: {e}")
+            return None
+        if row is not None:
+            self.agent_cache.invalidate(agent_id)
+            return row["version"]
+        if current is None:
+            print(f"Error patching agent state: agent {agent_id} not found")
+            return None
+        raise VersionConflictError(agent_id, expected_version, current["version"])
+
     def store_message(self, sender_id: str, receiver_id: str, content: str, 
                      message_type: str = 'general') -> bool:
         """Store a message between agents"""
-        query = """
-        INSERT INTO messages (sender_id, receiver_id, content, message_type)
-        VALUES (?, ?, ?, ?)
-        """
         try:
             with self.get_connection() as conn:
-                conn.execute(query, (sender_id, receiver_id, content, message_type))
+                cursor = self._execute(conn, "store_message",
+                                       (sender_id, receiver_id, *self._encode(content), message_type))
+                self._execute(conn, "index_message", (cursor.lastrowid, content))
                 return True
         except sqlite3.Error as e:
             print(f"Error storing message: {e}")
             return False
 
+    def _message_params(self, message: Union[Sequence, Any]) -> Tuple[Any, ...]:
+        """Normalise a Message-like object or a tuple into insert parameters"""
+        sender_id, receiver_id, content, message_type = self._message_fields(message)
+        return (sender_id, receiver_id, *self._encode(content), message_type)
+
+    @staticmethod
+    def _message_fields(message: Union[Sequence, Any]) -> Tuple[str, str, str, str]:
+        """(sender_id, receiver_id, content, message_type) of a Message-like object or a tuple"""
+        if isinstance(message, (tuple, list)):
+            if len(message) == 3:
+                sender_id, receiver_id, content = message
+                message_type = 'general'
+            else:
+                sender_id, receiver_id, content, message_type = message
+        else:
+            sender_id, receiver_id, content = message.sender_id, message.receiver_id, message.content
+            message_type = getattr(message, 'message_type', 'general')
+        return sender_id, receiver_id, content, message_type
+
+    def store_messages(self, messages: Iterable[Union[Sequence, Any]],
+                       chunk_size: int = 10000) -> List[int]:
+        """Store many messages with one executemany transaction per chunk and return their ids
+
+        Accepts Message objects (anything with sender_id, receiver_id, content
+        and optionally message_type) or (sender_id, receiver_id, content[,
+        message_type]) tuples. Ids are derived from last_insert_rowid(), which
+        is valid because each chunk holds the write lock while it inserts.
+        """
+        ids: List[int] = []
+        iterator = iter(messages)
+        try:
+            while True:
+                chunk = [self._message_fields(m) for m in islice(iterator, chunk_size)]
+                if not chunk:
+                    break
+                with self.get_connection(immediate=True) as conn:
+                    self._execute(conn, "store_message",
+                                  [(sender_id, receiver_id, *self._encode(content), message_type)
+                                   for sender_id, receiver_id, content, message_type in chunk], many=True)
+                    last_id = self._execute(conn, "last_insert_rowid", fetch="one")[0]
+                    chunk_ids = range(last_id - len(chunk) + 1, last_id + 1)
+                    self._execute(conn, "index_message",
+                                  [(message_id, fields[2]) for message_id, fields in zip(chunk_ids, chunk)],
+                                  many=True)
+                ids.extend(chunk_ids)
+            return ids
+        except sqlite3.Error as e:
+            print(f"Error storing messages: {e}")
+            return ids
+
     def get_agent_messages(self, agent_id: str, limit: int = 10) -> List[Dict]:
         """Get recent messages for an agent"""
-        query = """
-        SELECT * FROM messages 
-        WHERE sender_id = ? OR receiver_id = ?
-        ORDER BY timestamp DESC
-        LIMIT ?
+        return self._fetch_all("get_agent_messages", (agent_id, limit, agent_id, limit, limit))
+
+    def _message_sources(self) -> List[Optional[str]]:
+        """Where messages live, oldest first; None is the messages table in the main database"""
+        return [None]
+
+    def _message_page(self, agent_id: str, after_key: Tuple[Any, int], before: Optional[str],
+                      batch_size: int, source: Optional[str] = None) -> List[Dict]:
+        """Fetch the next batch_size messages for an agent from a source after a (timestamp, id) key"""
+        name = "message_page_before" if before is not None else "message_page"
+        branch_params = (agent_id, *after_key) + ((before,) if before is not None else ()) + (batch_size,)
+        with self.pool.connection() as conn:
+            rows = self._execute(conn, name, branch_params + branch_params + (batch_size,),
+                                 fetch=batch_size)
+            return [self._decode_row(row) for row in rows]
+
+    def iter_agent_messages(self, agent_id: str, after: Optional[str] = None,
+                            before: Optional[str] = None, batch_size: int = 500) -> Iterator[Dict]:
+        """Yield an agent's messages oldest first, strictly between after and before
+
+        Uses keyset pagination on (timestamp, id), so each batch is an index
+        seek and memory stays at one batch regardless of history size. The
+        pooled connection is returned between batches.
+        """
+        for source in self._message_sources():
+            # (after, max rowid) skips every row at the `after` timestamp itself
+            after_key: Tuple[Any, int] = (after, 2 ** 63 - 1) if after is not None else ("", 0)
+            while True:
+                try:
+                    rows = self._message_page(agent_id, after_key, before, batch_size, source)
+                except sqlite3.Error as e:
+                    print(f"Error iterating messages: {e}")
+                    return
+                yield from rows
+                if len(rows) < batch_size:
+                    break
+                after_key = (rows[-1]["timestamp"], rows[-1]["id"])
+
+    def search_messages(self, query: str, agent_id: Optional[str] = None,
+                        limit: int = 20, offset: int = 0) -> List[Dict]:
+        """Full-text search over message content, best bm25 matches first
+
+        query uses FTS5 syntax (terms, "phrases", AND/OR/NOT, prefix*). Each
+        result carries its bm25 `rank` (lower is better) and a `snippet` with
+        matches wrapped in [brackets]. The index is contentless, so it adds
+        only the inverted index on top of the (possibly compressed) messages.
         """
-        cursor = self._execute_query(query, (agent_id, agent_id, limit))
-        if cursor:
-            return [dict(row) for row in cursor.fetchall()]
-        return []
+        if agent_id is None:
+            rows = self._fetch_all("search_messages", (query, limit, offset))
+        else:
+            rows = self._fetch_all("search_agent_messages", (query, agent_id, agent_id, limit, offset))
+        for row in rows:
+            row["snippet"] = make_snippet(row["content"], query)
+        return rows
+
+    def optimize_search_index(self, rebuild: bool = False) -> bool:
+        """Merge the FTS index segments, optionally re-indexing every message first
+
+        Bulk loads leave the index split into many small segments; optimizing
+        afterwards merges them so queries touch one b-tree. rebuild=True
+        recreates the index from the messages table, e.g. after rows were
+        written or deleted by other tools.
+        """
+        try:
+            with self.get_connection() as conn:
+                if rebuild:
+                    self._execute(conn, "clear_search_index")
+                    self._execute(conn, "rebuild_search_index")
+                self._execute(conn, "optimize_search_index")
+            return True
+        except sqlite3.Error as e:
+            print(f"Error optimizing search index: {e}")
+            return False
 
     def mark_message_processed(self, message_id: int) -> bool:
         """Mark a message as processed"""
-        query = "UPDATE messages SET processed = TRUE WHERE id = ?"
         try:
             with self.get_connection() as conn:
-                conn.execute(query, (message_id,))
+                self._execute(conn, "mark_message_processed", (message_id,))
                 return True
         except sqlite3.Error as e:
             print(f"Error marking message as processed: {e}")
             return False
 
+    def claim_messages(self, receiver_id: str, n: int = 10,
+                       lease_seconds: float = 60.0) -> List[Dict]:
+        """Lease up to n unprocessed messages for a receiver, oldest first
+
+        Messages whose lease has expired (e.g. their worker crashed) are
+        claimable again. Claimed messages must be acknowledged with
+        ack_messages before the lease runs out or they will be redelivered.
+        """
+        now = time.time()
+        try:
+            with self.get_connection(immediate=True) as conn:
+                rows = self._execute(conn, "claim_messages", (now + lease_seconds, receiver_id, now, n),
+                                     fetch="all")
+            return sorted((self._decode_row(row) for row in rows),
+                          key=lambda row: (row["timestamp"], row["id"]))
+        except sqlite3.Error as e:
+            print(f"Error claiming messages: {e}")
+            return []
+
+    def ack_messages(self, message_ids: Iterable[int]) -> int:
+        """Mark claimed messages as processed and return how many were updated"""
+        try:
+            with self.get_connection() as conn:
+                return self._execute(conn, "mark_message_processed",
+                                     [(message_id,) for message_id in message_ids], many=True).rowcount
+        except sqlite3.Error as e:
+            print(f"Error acknowledging messages: {e}")
+            return 0
+
+    def release_messages(self, message_ids: Iterable[int]) -> int:
+        """Give up leases early so other workers can claim the messages immediately"""
+        try:
+            with self.get_connection() as conn:
+                return self._execute(conn, "release_messages",
+                                     [(message_id,) for message_id in message_ids], many=True).rowcount
+        except sqlite3.Error as e:
+            print(f"Error releasing messages: {e}")
+            return 0
+
     def get_active_agents(self, minutes: int = 60) -> List[Dict]:
         """Get agents active within the last X minutes"""
-        query = """
-        SELECT * FROM agents 
-        WHERE last_active >= datetime('now', ? || ' minutes')
-        ORDER BY last_active DESC
+        return self._fetch_all("get_active_agents", (f'-{minutes}',))
+
+    @staticmethod
+    def format_timestamp(unix_time: float) -> str:
+        """Format a Unix time the way SQLite's CURRENT_TIMESTAMP does (UTC)"""
+        return datetime.fromtimestamp(unix_time, timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+    def touch_agents(self, activity: Dict[str, float]) -> bool:
+        """Record last_active for many agents at once from {agent_id: unix_time}"""
+        params = []
+        for agent_id, unix_time in activity.items():
+            timestamp = self.format_timestamp(unix_time)
+            params.append((timestamp, agent_id, timestamp))
+        try:
+            with self.get_connection() as conn:
+                self._execute(conn, "touch_agents", params, many=True)
+            self.agent_cache.invalidate(*activity)
+            return True
+        except sqlite3.Error as e:
+            print(f"Error updating agent activity: {e}")
+            return False
+
+    def iter_cleanup_old_messages(self, days: int = 30, chunk_size: int = 5000,
+                                  pause: float = 0.01,
+                                  vacuum_pages: Optional[int] = None) -> Iterator[Dict]:
+        """Delete messages older than X days in chunks, yielding stats per chunk
+
+        Each chunk is its own short transaction deleting at most chunk_size
+        of the oldest expired rows, found through the timestamp index, so
+        live writers only ever wait for one chunk and rows are expired by
+        their timestamp whatever their id. vacuum_pages, if set, runs
+        incremental_vacuum after each chunk (0 frees every free page).
         """
-        cursor = self._execute_query(query, (f'-{minutes}',))
-        if cursor:
-            return [dict(row) for row in cursor.fetchall()]
-        return []
+        with self.pool.connection() as conn:
+            cutoff = self._execute(conn, "cleanup_cutoff", (f'-{days}',), fetch="one")[0]
+        chunk = 0
+        while True:
+            started = time.perf_counter()
+            with self.get_connection() as conn:
+                step = self._cleanup_chunk(conn, cutoff, chunk_size)
+            if step is None:
+                return
+            first_id, last_id, deleted = step
+            if vacuum_pages is not None:
+                with self.pool.connection() as conn:
+                    self._incremental_vacuum(conn, vacuum_pages)
+            chunk += 1
+            yield {
+                "chunk": chunk,
+                "rows": deleted,
+                "first_id": first_id,
+                "last_id": last_id,
+                "seconds": time.perf_counter() - started,
+            }
+            if pause:
+                time.sleep(pause)
+
+    def _cleanup_chunk(self, conn: sqlite3.Connection, cutoff: str,
+                       chunk_size: int) -> Optional[Tuple[int, int, int]]:
+        """Delete up to chunk_size expired rows; returns (lowest id, highest id, count), None once none are left"""
+        rows = self._execute(conn, "cleanup_delete_chunk", (cutoff, chunk_size), fetch="all")
+        if not rows:
+            return None
+        self._execute(conn, "unindex_message",
+                      [(row["id"], decompress_value(row["codec"], row["content"])) for row in rows], many=True)
+        ids = [row["id"] for row in rows]
+        return min(ids), max(ids), len(ids)
+
+    @staticmethod
+    def _incremental_vacuum(conn: sqlite3.Connection, pages: int) -> None:
+        """Return up to pages free pages to the filesystem (0 frees all of them)"""
+        # executescript steps the pragma to completion; execute() would free
+        # only a single page
+        conn.executescript(f"PRAGMA incremental_vacuum({int(pages)});")
 
-    def cleanup_old_messages(self, days: int = 30) -> bool:
+    def cleanup_old_messages(self, days: int = 30, chunk_size: int = 5000,
+                             pause: float = 0.0) -> bool:
         """Remove messages older than X days"""
-        query = "DELETE FROM messages WHERE timestamp < datetime('now', ? || ' days')"
         try:
-            with self.get_connection() as conn:
-                conn.execute(query, (f'-{days}',))
-                return True
+            for _ in self.iter_cleanup_old_messages(days, chunk_size=chunk_size, pause=pause):
+                pass
+            return True
         except sqlite3.Error as e:
             print(f"Error cleaning up messages: {e}")
-            return False
\ No newline at end of file
+            return False
+
+    # Column used for since/until filters when exporting each table
+    EXPORT_TIME_COLUMNS = {"messages": "timestamp", "agents": "last_active"}
+
+    def iter_table_chunks(self, table: str, columns: Optional[List[str]] = None,
+                          since: Optional[str] = None, until: Optional[str] = None,
+                          chunk_size: int = 50000) -> Iterator[Tuple[List[str], List[tuple]]]:
+        """Yield (column names, row tuples) chunks of a table in rowid order
+
+        Rows come back as plain tuples rather than dicts, chunks are fetched
+        with rowid keyset pagination so memory is bounded by chunk_size, and
+        compressed content/state is decompressed on the way out. since/until
+        filter on the table's time column (inclusive/exclusive).
+        """
+        if table not in self.EXPORT_TIME_COLUMNS:
+            raise ValueError(f"Cannot export table '{table}'")
+        with self.pool.connection() as conn:
+            available = [row["name"] for row in conn.execute(f"PRAGMA table_info({table})")]
+        columns = columns or self._table_columns(table)
+        unknown = set(columns) - set(available)
+        if unknown:
+            raise ValueError(f"Unknown columns for {table}: {sorted(unknown)}")
+
+        # Decompress (value column, codec column) pairs that were selected
+        selected = list(columns)
+        codec_pairs = []
+        for value_column, codec_column in (("content", "codec"), ("state", "state_codec")):
+            if value_column in columns and codec_column in available:
+                codec_pairs.append((columns.index(value_column), len(selected)))
+                selected.append(codec_column)
+
+        time_column = self.EXPORT_TIME_COLUMNS[table]
+        filters, params = "", []
+        if since is not None:
+            filters += f" AND {time_column} >= ?"
+            params.append(since)
+        if until is not None:
+            filters += f" AND {time_column} < ?"
+            params.append(until)
+        query = f"""
+        SELECT rowid, {", ".join(selected)} FROM {{source}}
+        WHERE rowid > ?{filters}
+        ORDER BY rowid LIMIT ?
+        """
+        for source in self._export_sources(table):
+            last_rowid = 0
+            while True:
+                with self.pool.connection() as conn:
+                    source_table = self._export_source_table(conn, table, source)
+                    if source_table is None:
+                        break
+                    cursor = conn.cursor()
+                    cursor.row_factory = None  # Tuples are much cheaper than Row/dict
+                    rows = self._execute(cursor, f"export_{table}", (last_rowid, *params, chunk_size),
+                                         sql=query.format(source=source_table), fetch=chunk_size)
+                if not rows:
+                    break
+                last_rowid = rows[-1][0]
+                if codec_pairs:
+                    decoded = []
+                    for row in rows:
+                        row = list(row[1:])
+                        for value_index, codec_index in codec_pairs:
+                            row[value_index] = decompress_value(row[codec_index], row[value_index])
+                        decoded.append(tuple(row[:len(columns)]))
+                    yield columns, decoded
+                else:
+                    yield columns, [row[1:] for row in rows]
+                if len(rows) < chunk_size:
+                    break
+
+    def _export_sources(self, table: str) -> List[Optional[str]]:
+        """Where a table's rows live, in export order; None is the table in the main database"""
+        return [None]
+
+    def _export_source_table(self, conn: sqlite3.Connection, table: str,
+                             source: Optional[str]) -> Optional[str]:
+        """Name to select a source's rows from on conn, or None to skip the source"""
+        return table
+
+    def _arrow_schema(self, table: str, columns: List[str]) -> Any:
+        """Map declared SQLite column types to an Arrow schema"""
+        with self.pool.connection() as conn:
+            declared = {row["name"]: (row["type"] or "").upper()
+                        for row in conn.execute(f"PRAGMA table_info({table})")}
+        fields = []
+        for column in columns:
+            sql_type = declared[column]
+            if "INT" in sql_type or "BOOL" in sql_type:
+                arrow_type = pa.int64()
+            elif "REAL" in sql_type or "FLOA" in sql_type or "DOUB" in sql_type:
+                arrow_type = pa.float64()
+            else:
+                arrow_type = pa.string()
+            fields.append(pa.field(column, arrow_type))
+        return pa.schema(fields)
+
+    def export_table(self, table: str, path: str, format: Optional[str] = None,
+                     columns: Optional[List[str]] = None, since: Optional[str] = None,
+                     until: Optional[str] = None, chunk_size: int = 50000) -> Dict[str, Any]:
+        """Stream a table to Parquet (needs pyarrow) or CSV and return export stats
+
+        format defaults to "parquet" when pyarrow is installed and "csv"
+        otherwise. Each chunk becomes one Arrow record batch / Parquet row
+        group, so memory stays bounded by chunk_size.
+        """
+        format = format or ("parquet" if pa is not None else "csv")
+        if format not in ("parquet", "csv"):
+            raise ValueError(f"Unknown export format '{format}', expected 'parquet' or 'csv'")
+        if format == "parquet" and pa is None:
+            raise ImportError("Parquet export requires pyarrow; use format='csv'")
+        names = columns or self._table_columns(table)
+        started = time.perf_counter()
+        rows = batches = 0
+        chunks = self.iter_table_chunks(table, names, since, until, chunk_size)
+        if format == "parquet":
+            schema = self._arrow_schema(table, names)
+            writer = pq.ParquetWriter(path, schema)
+            try:
+                for _, chunk in chunks:
+                    # Transpose row tuples into one Arrow array per column
+                    arrays = [pa.array(values, type=field.type)
+                              for values, field in zip(zip(*chunk), schema)]
+                    writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+                    rows += len(chunk)
+                    batches += 1
+            finally:
+                writer.close()
+        else:
+            with open(path, "w", newline="", encoding="utf-8") as handle:
+                writer = csv.writer(handle)
+                writer.writerow(names)
+                for _, chunk in chunks:
+                    writer.writerows(chunk)
+                    rows += len(chunk)
+                    batches += 1
+        seconds = time.perf_counter() - started
+        return {
+            "table": table,
+            "path": path,
+            "format": format,
+            "rows": rows,
+            "batches": batches,
+            "seconds": seconds,
+            "rows_per_second": rows / seconds if seconds else 0.0,
+        }
+
+    def _table_columns(self, table: str) -> List[str]:
+        """Exportable column names of a table (codec markers excluded)"""
+        with self.pool.connection() as conn:
+            return [row["name"] for row in conn.execute(f"PRAGMA table_info({table})")
+                    if row["name"] not in ("codec", "state_codec")]
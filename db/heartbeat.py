@@ -0,0 +1,109 @@
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from database import resolve
+
+class HeartbeatTracker:
+    """Aggregates agent activity in memory and writes coalesced last_active updates
+
+    touch() only records a timestamp in a dict; a background thread flushes
+    every agent touched since the last flush with one batched UPDATE and then
+    refreshes an in-memory view of recently active agents, which
+    get_active_agents() serves while it is fresh.
+    """
+    def __init__(self, db: Any, flush_interval: float = 5.0, window_minutes: int = 60):
+        self.db = db
+        self.flush_interval = flush_interval
+        self.window_minutes = window_minutes
+        self._pending: Dict[str, float] = {}
+        self._snapshot: Dict[str, Dict] = {}
+        self._snapshot_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self.stats = {"touches": 0, "flushes": 0, "rows_flushed": 0,
+                      "served_from_memory": 0, "served_from_db": 0}
+        self._thread = threading.Thread(target=self._run, name="heartbeat", daemon=True)
+        self._thread.start()
+
+    def __enter__(self) -> "HeartbeatTracker":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def touch(self, agent_id: str, unix_time: Optional[float] = None) -> None:
+        """Record that an agent was active; repeated touches before a flush coalesce"""
+        unix_time = time.time() if unix_time is None else unix_time
+        with self._lock:
+            if unix_time > self._pending.get(agent_id, 0.0):
+                self._pending[agent_id] = unix_time
+            self.stats["touches"] += 1
+
+    def flush(self) -> None:
+        """Write pending activity and refresh the in-memory view of active agents"""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if pending:
+                try:
+                    written = resolve(self.db.touch_agents(pending))  # A Future when serialized
+                except sqlite3.Error as e:
+                    print(f"Error flushing heartbeats: {e}")
+                    written = False
+                with self._lock:
+                    if written:
+                        self.stats["rows_flushed"] += len(pending)
+                    else:
+                        for agent_id, unix_time in pending.items():
+                            self._pending.setdefault(agent_id, unix_time)
+                    self.stats["flushes"] += 1
+            rows = self.db.get_active_agents(self.window_minutes)
+            with self._lock:
+                self._snapshot = {row["agent_id"]: row for row in rows}
+                self._snapshot_at = time.monotonic()
+
+    def _is_fresh(self) -> bool:
+        return (self._snapshot_at is not None
+                and time.monotonic() - self._snapshot_at <= 2 * self.flush_interval)
+
+    def get_active_agents(self, minutes: int = 60) -> List[Dict]:
+        """Agents active within the last X minutes, including touches not yet flushed"""
+        with self._lock:
+            fresh = self._is_fresh() and minutes <= self.window_minutes
+            if fresh:
+                snapshot = {agent_id: dict(row) for agent_id, row in self._snapshot.items()}
+                pending = dict(self._pending)
+                self.stats["served_from_memory"] += 1
+            else:
+                self.stats["served_from_db"] += 1
+        if not fresh:
+            self.flush()
+            return self.db.get_active_agents(minutes)
+
+        for agent_id, unix_time in pending.items():
+            row = snapshot.get(agent_id) or self.db.get_agent(agent_id)
+            if row is None:
+                continue
+            timestamp = self.db.format_timestamp(unix_time)
+            if row.get("last_active") is None or row["last_active"] < timestamp:
+                row["last_active"] = timestamp
+            snapshot[agent_id] = row
+        cutoff = self.db.format_timestamp(time.time() - minutes * 60)
+        active = [row for row in snapshot.values() if row["last_active"] >= cutoff]
+        return sorted(active, key=lambda row: row["last_active"], reverse=True)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error flushing heartbeats: {e}")
+
+    def close(self) -> None:
+        """Stop the background thread and write any pending activity"""
+        self._stop.set()
+        self._thread.join()
+        self.flush()
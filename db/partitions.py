@@ -0,0 +1,448 @@
+import os
+import re
+import sqlite3
+import time
+from datetime import date, datetime, timedelta, timezone
+from itertools import islice
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+from database import STATEMENTS, DatabaseManager, make_snippet
+
+# Columns of a partition's messages table; mirrors the main table after all migrations
+PARTITION_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS {schema}.messages (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        sender_id TEXT NOT NULL,
+        receiver_id TEXT NOT NULL,
+        content TEXT NOT NULL,
+        message_type TEXT DEFAULT 'general',
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+        processed BOOLEAN DEFAULT FALSE,
+        lease_expires_at REAL,
+        codec TEXT
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS {schema}.idx_messages_receiver_ts ON messages (receiver_id, timestamp)",
+    "CREATE INDEX IF NOT EXISTS {schema}.idx_messages_sender_ts ON messages (sender_id, timestamp)",
+    """
+    CREATE INDEX IF NOT EXISTS {schema}.idx_messages_unprocessed
+    ON messages (receiver_id, timestamp) WHERE processed = FALSE
+    """,
+    "CREATE VIRTUAL TABLE IF NOT EXISTS {schema}.messages_fts USING fts5(content, content='')",
+]
+
+# Recorded in each partition's user_version. Version 1 partitions kept a
+# plain-text copy of every message in messages_fts; version 2 is contentless.
+PARTITION_VERSION = 2
+
+# Pragmas that apply per attached database rather than per connection
+SCHEMA_PRAGMAS = ("auto_vacuum", "journal_mode", "synchronous", "cache_size", "mmap_size")
+
+# Table references in STATEMENTS that must point at a partition's tables
+_TABLE_REFERENCE = re.compile(r"\b(FROM|JOIN|INTO|UPDATE)\s+(messages(?:_fts)?)\b")
+
+class PartitionedDatabaseManager(DatabaseManager):
+    """DatabaseManager that stores messages in one SQLite file per day or week
+
+    Agents stay in the main database. Messages are written to the partition
+    for the current UTC day/week, which is ATTACHed to the pooled connection
+    on demand with the profile's pragmas. Ids are unique across partitions
+    because each partition starts its AUTOINCREMENT sequence at its period's
+    day number << 32, so an id also names its partition. Reads, the work
+    queue, search and export span the main messages table (rows written
+    before partitioning) and every partition. Retention drops whole
+    partition files instead of deleting rows.
+    """
+    PERIODS = ("day", "week")
+
+    def __init__(self, db_path: str = "db/test.db", partition_dir: Optional[str] = None,
+                 period: str = "day", **kwargs: Any):
+        if period not in self.PERIODS:
+            raise ValueError(f"Unknown partition period '{period}', expected one of {self.PERIODS}")
+        self.period = period
+        self.partition_dir = Path(partition_dir or f"{os.path.splitext(db_path)[0]}_partitions")
+        self.partition_dir.mkdir(parents=True, exist_ok=True)
+        self._dropped: set = set()
+        super().__init__(db_path, **kwargs)
+
+    def _period_start(self, day: date) -> date:
+        return day - timedelta(days=day.weekday()) if self.period == "week" else day
+
+    def _partition_key(self, day: date) -> str:
+        return self._period_start(day).isoformat()
+
+    def _current_key(self) -> str:
+        return self._partition_key(datetime.now(timezone.utc).date())
+
+    def _partition_path(self, key: str) -> Path:
+        return self.partition_dir / f"messages-{self.period}-{key}.db"
+
+    @staticmethod
+    def _schema(key: str) -> str:
+        return "p_" + key.replace("-", "_")
+
+    @staticmethod
+    def _key_for_id(message_id: int) -> Optional[str]:
+        """Partition key encoded in a message id; None for rows of the main table"""
+        day_number = message_id >> 32
+        if day_number == 0:
+            return None
+        return (date(1970, 1, 1) + timedelta(days=day_number)).isoformat()
+
+    @staticmethod
+    def _in_schema(sql: str, schema: str) -> str:
+        """Point a statement's messages and messages_fts tables at an attached schema"""
+        return _TABLE_REFERENCE.sub(rf"\1 {schema}.\2", sql)
+
+    def partitions(self) -> List[str]:
+        """Keys (period start dates) of existing partitions, newest first"""
+        pattern = re.compile(rf"messages-{self.period}-(\d{{4}}-\d{{2}}-\d{{2}})\.db$")
+        keys = [match.group(1) for path in self.partition_dir.iterdir()
+                if (match := pattern.match(path.name))]
+        return sorted((key for key in keys if key not in self._dropped), reverse=True)
+
+    def _attach(self, conn: sqlite3.Connection, key: str, create: bool = False) -> Optional[str]:
+        """Make sure a partition is attached to conn and return its schema name"""
+        path = self._partition_path(key)
+        if not create and not path.exists():
+            return None
+        attached = [row[1] for row in conn.execute("PRAGMA database_list")]
+        for name in attached:
+            # Detach partitions that were dropped since this connection last used them
+            if name.startswith("p_") and name[2:].replace("_", "-") in self._dropped:
+                conn.execute(f"DETACH DATABASE {name}")
+                attached.remove(name)
+        schema = self._schema(key)
+        if schema in attached:
+            return schema
+        partitions = [name for name in attached if name.startswith("p_")]
+        if len(partitions) + 1 >= conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED):
+            conn.execute(f"DETACH DATABASE {partitions[0]}")
+        is_new = not path.exists()
+        conn.execute("ATTACH DATABASE ? AS " + schema, (str(path),))
+        # ATTACH starts from SQLite's defaults (rollback journal, synchronous=FULL);
+        # auto_vacuum only takes effect here, before the partition has tables
+        for name in SCHEMA_PRAGMAS:
+            if name in self.pragmas:
+                conn.execute(f"PRAGMA {schema}.{name} = {self.pragmas[name]}").fetchall()
+        if is_new or create:
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                for statement in PARTITION_SCHEMA:
+                    conn.execute(statement.format(schema=schema))
+                seeded = conn.execute(
+                    f"SELECT 1 FROM {schema}.sqlite_sequence WHERE name = 'messages'").fetchone()
+                if not seeded:
+                    base = (date.fromisoformat(key) - date(1970, 1, 1)).days << 32
+                    conn.execute(f"INSERT INTO {schema}.sqlite_sequence (name, seq) VALUES ('messages', ?)",
+                                 (base,))
+        if conn.execute(f"PRAGMA {schema}.user_version").fetchone()[0] < PARTITION_VERSION:
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                # Reindex partitions written before the search index was contentless
+                conn.execute(f"DROP TABLE IF EXISTS {schema}.messages_fts")
+                conn.execute(PARTITION_SCHEMA[-1].format(schema=schema))
+                self._execute(conn, "partition_rebuild_search_index",
+                              sql=self._in_schema(STATEMENTS["rebuild_search_index"], schema))
+                conn.execute(f"PRAGMA {schema}.user_version = {PARTITION_VERSION}")
+        return schema
+
+    def _source_keys(self, newest_first: bool = False) -> List[Optional[str]]:
+        """Keys of the main table (None) and every partition, oldest first by default"""
+        keys: List[Optional[str]] = [None, *reversed(self.partitions())]
+        return keys[::-1] if newest_first else keys
+
+    def _source_schema(self, conn: sqlite3.Connection, key: Optional[str]) -> Optional[str]:
+        return "main" if key is None else self._attach(conn, key)
+
+    def _sources(self, conn: sqlite3.Connection, newest_first: bool = False) -> Iterator[Tuple[Optional[str], str]]:
+        """Yield (partition key, schema) of the main table and every partition, oldest first by default
+
+        Each partition is attached only when its turn comes, since attaching
+        one may detach another to stay under SQLite's limit of attached
+        databases; query a schema before advancing to the next source.
+        """
+        for key in self._source_keys(newest_first):
+            schema = self._source_schema(conn, key)
+            if schema is not None:
+                yield key, schema
+
+    @staticmethod
+    def _insert_sql(schema: str) -> str:
+        return f"""
+        INSERT INTO {schema}.messages (sender_id, receiver_id, content, codec, message_type)
+        VALUES (?, ?, ?, ?, ?)
+        """
+
+    def store_message(self, sender_id: str, receiver_id: str, content: str,
+                      message_type: str = 'general') -> bool:
+        """Store a message in the current partition"""
+        try:
+            with self.pool.connection() as conn:
+                schema = self._attach(conn, self._current_key(), create=True)
+                with conn:
+                    cursor = self._execute(conn, "partition_store_message",
+                                           (sender_id, receiver_id, *self._encode(content), message_type),
+                                           sql=self._insert_sql(schema))
+                    self._execute(conn, "partition_index_message", (cursor.lastrowid, content),
+                                  sql=self._in_schema(STATEMENTS["index_message"], schema))
+            return True
+        except sqlite3.Error as e:
+            print(f"Error storing message: {e}")
+            return False
+
+    def store_messages(self, messages: Iterable[Union[Sequence, Any]],
+                       chunk_size: int = 10000) -> List[int]:
+        """Store many messages in the current partition, one transaction per chunk"""
+        ids: List[int] = []
+        iterator = iter(messages)
+        try:
+            with self.pool.connection() as conn:
+                while True:
+                    chunk = [self._message_fields(m) for m in islice(iterator, chunk_size)]
+                    if not chunk:
+                        break
+                    schema = self._attach(conn, self._current_key(), create=True)
+                    with conn:
+                        conn.execute("BEGIN IMMEDIATE")
+                        self._execute(conn, "partition_store_message",
+                                      [(sender_id, receiver_id, *self._encode(content), message_type)
+                                       for sender_id, receiver_id, content, message_type in chunk],
+                                      sql=self._insert_sql(schema), many=True)
+                        last_id = self._execute(conn, "last_insert_rowid", fetch="one")[0]
+                        chunk_ids = range(last_id - len(chunk) + 1, last_id + 1)
+                        self._execute(conn, "partition_index_message",
+                                      [(message_id, fields[2]) for message_id, fields in zip(chunk_ids, chunk)],
+                                      sql=self._in_schema(STATEMENTS["index_message"], schema), many=True)
+                    ids.extend(chunk_ids)
+            return ids
+        except sqlite3.Error as e:
+            print(f"Error storing messages: {e}")
+            return ids
+
+    def get_agent_messages(self, agent_id: str, limit: int = 10) -> List[Dict]:
+        """Get recent messages for an agent across partitions, newest first, then the main table"""
+        results: List[Dict] = []
+        try:
+            with self.pool.connection() as conn:
+                for key, schema in self._sources(conn, newest_first=True):
+                    remaining = limit - len(results)
+                    if remaining <= 0:
+                        break
+                    rows = self._execute(conn, "partition_get_agent_messages",
+                                         (agent_id, remaining, agent_id, remaining, remaining),
+                                         sql=self._in_schema(STATEMENTS["get_agent_messages"], schema),
+                                         fetch="all")
+                    for row in rows:
+                        message = self._decode_row(row)
+                        message["partition"] = key
+                        results.append(message)
+        except sqlite3.Error as e:
+            print(f"Database error: {e}")
+        return results
+
+    def _message_sources(self) -> List[Optional[str]]:
+        """The main table, then partitions oldest first"""
+        return self._source_keys()
+
+    def _message_page(self, agent_id: str, after_key: Tuple[Any, int], before: Optional[str],
+                      batch_size: int, source: Optional[str] = None) -> List[Dict]:
+        """Fetch a page from the main table or one partition, tagging rows with their partition"""
+        name = "message_page_before" if before is not None else "message_page"
+        branch_params = (agent_id, *after_key) + ((before,) if before is not None else ()) + (batch_size,)
+        with self.pool.connection() as conn:
+            schema = self._source_schema(conn, source)
+            if schema is None:
+                return []  # Dropped while iterating
+            rows = self._execute(conn, f"partition_{name}", branch_params + branch_params + (batch_size,),
+                                 sql=self._in_schema(STATEMENTS[name], schema), fetch=batch_size)
+        results = [self._decode_row(row) for row in rows]
+        for row in results:
+            row["partition"] = source
+        return results
+
+    def search_messages(self, query: str, agent_id: Optional[str] = None,
+                        limit: int = 20, offset: int = 0) -> List[Dict]:
+        """Full-text search over the main table and every partition, best bm25 matches first"""
+        name = "search_messages" if agent_id is None else "search_agent_messages"
+        wanted = limit + offset
+        params = (query, wanted, 0) if agent_id is None else (query, agent_id, agent_id, wanted, 0)
+        results: List[Dict] = []
+        try:
+            with self.pool.connection() as conn:
+                for key, schema in self._sources(conn):
+                    rows = self._execute(conn, f"partition_{name}", params,
+                                         sql=self._in_schema(STATEMENTS[name], schema), fetch="all")
+                    for row in rows:
+                        message = self._decode_row(row)
+                        message["partition"] = key
+                        results.append(message)
+        except sqlite3.Error as e:
+            print(f"Database error: {e}")
+            return []
+        results.sort(key=lambda row: row["rank"])
+        results = results[offset:wanted]
+        for row in results:
+            row["snippet"] = make_snippet(row["content"], query)
+        return results
+
+    def optimize_search_index(self, rebuild: bool = False) -> bool:
+        """Merge the FTS index segments of the main table and every partition"""
+        try:
+            with self.pool.connection() as conn:
+                for _, schema in self._sources(conn):
+                    with conn:
+                        if rebuild:
+                            for name in ("clear_search_index", "rebuild_search_index"):
+                                self._execute(conn, f"partition_{name}",
+                                              sql=self._in_schema(STATEMENTS[name], schema))
+                        self._execute(conn, "partition_optimize_search_index",
+                                      sql=self._in_schema(STATEMENTS["optimize_search_index"], schema))
+            return True
+        except sqlite3.Error as e:
+            print(f"Error optimizing search index: {e}")
+            return False
+
+    def claim_messages(self, receiver_id: str, n: int = 10,
+                       lease_seconds: float = 60.0) -> List[Dict]:
+        """Lease up to n unprocessed messages for a receiver, oldest partition first"""
+        now = time.time()
+        claimed: List[Dict] = []
+        try:
+            with self.pool.connection() as conn:
+                for _, schema in self._sources(conn):
+                    remaining = n - len(claimed)
+                    if remaining <= 0:
+                        break
+                    with conn:
+                        conn.execute("BEGIN IMMEDIATE")
+                        rows = self._execute(conn, "partition_claim_messages",
+                                             (now + lease_seconds, receiver_id, now, remaining),
+                                             sql=self._in_schema(STATEMENTS["claim_messages"], schema),
+                                             fetch="all")
+                    claimed.extend(sorted((self._decode_row(row) for row in rows),
+                                          key=lambda row: (row["timestamp"], row["id"])))
+        except sqlite3.Error as e:
+            print(f"Error claiming messages: {e}")
+        return claimed
+
+    def _update_by_id(self, name: str, message_ids: Iterable[int]) -> int:
+        """Run a per-id statement against the partition each id belongs to; returns rows updated"""
+        by_key: Dict[Optional[str], List[Tuple[int]]] = {}
+        for message_id in message_ids:
+            by_key.setdefault(self._key_for_id(message_id), []).append((message_id,))
+        updated = 0
+        with self.pool.connection() as conn:
+            for key, params in by_key.items():
+                schema = self._source_schema(conn, key)
+                if schema is None:
+                    continue  # Partition already dropped
+                with conn:
+                    updated += self._execute(conn, f"partition_{name}", params,
+                                             sql=self._in_schema(STATEMENTS[name], schema),
+                                             many=True).rowcount
+        return updated
+
+    def mark_message_processed(self, message_id: int) -> bool:
+        """Mark a message as processed in whichever partition holds it"""
+        try:
+            self._update_by_id("mark_message_processed", [message_id])
+            return True
+        except sqlite3.Error as e:
+            print(f"Error marking message as processed: {e}")
+            return False
+
+    def ack_messages(self, message_ids: Iterable[int]) -> int:
+        """Mark claimed messages as processed and return how many were updated"""
+        try:
+            return self._update_by_id("mark_message_processed", message_ids)
+        except sqlite3.Error as e:
+            print(f"Error acknowledging messages: {e}")
+            return 0
+
+    def release_messages(self, message_ids: Iterable[int]) -> int:
+        """Give up leases early so other workers can claim the messages immediately"""
+        try:
+            return self._update_by_id("release_messages", message_ids)
+        except sqlite3.Error as e:
+            print(f"Error releasing messages: {e}")
+            return 0
+
+    def _expired_partitions(self, cutoff: date) -> List[str]:
+        """Keys of partitions whose whole period ends on or before cutoff"""
+        span = timedelta(days=7 if self.period == "week" else 1)
+        return [key for key in self.partitions() if date.fromisoformat(key) + span <= cutoff]
+
+    def _drop_partition(self, key: str) -> None:
+        self._dropped.add(key)
+        # Connections still holding the file detach it the next time they
+        # attach a partition; unlinking an open file is safe on POSIX
+        with self.pool.connection() as conn:
+            schema = self._schema(key)
+            if schema in [row[1] for row in conn.execute("PRAGMA database_list")]:
+                conn.execute(f"DETACH DATABASE {schema}")
+        path = self._partition_path(key)
+        for suffix in ("", "-wal", "-shm"):
+            Path(f"{path}{suffix}").unlink(missing_ok=True)
+
+    def drop_partitions_before(self, cutoff: date) -> List[str]:
+        """Delete partition files whose whole period ends on or before cutoff"""
+        dropped = self._expired_partitions(cutoff)
+        for key in dropped:
+            self._drop_partition(key)
+        return dropped
+
+    def iter_cleanup_old_messages(self, days: int = 30, chunk_size: int = 5000,
+                                  pause: float = 0.01,
+                                  vacuum_pages: Optional[int] = None) -> Iterator[Dict]:
+        """Delete expired rows of the main table in chunks, then drop expired partitions
+
+        Yields DatabaseManager's per-chunk stats followed by one entry per
+        dropped partition, with its row count and key under "partition".
+        """
+        chunk = 0
+        for chunk, stats in enumerate(super().iter_cleanup_old_messages(
+                days, chunk_size=chunk_size, pause=pause, vacuum_pages=vacuum_pages), 1):
+            yield stats
+        for key in reversed(self._expired_partitions(datetime.now(timezone.utc).date() - timedelta(days=days))):
+            started = time.perf_counter()
+            with self.pool.connection() as conn:
+                schema = self._attach(conn, key)
+                if schema is None:
+                    continue
+                rows, first_id, last_id = conn.execute(
+                    f"SELECT COUNT(*), MIN(id), MAX(id) FROM {schema}.messages").fetchone()
+            self._drop_partition(key)
+            chunk += 1
+            yield {
+                "chunk": chunk,
+                "rows": rows,
+                "first_id": first_id,
+                "last_id": last_id,
+                "seconds": time.perf_counter() - started,
+                "partition": key,
+            }
+
+    def cleanup_old_messages(self, days: int = 30, chunk_size: int = 5000,
+                             pause: float = 0.0) -> bool:
+        """Remove messages older than X days; a partition is dropped once all of it has expired"""
+        try:
+            for _ in self.iter_cleanup_old_messages(days, chunk_size=chunk_size, pause=pause):
+                pass
+            return True
+        except (sqlite3.Error, OSError) as e:
+            print(f"Error cleaning up messages: {e}")
+            return False
+
+    def _export_sources(self, table: str) -> List[Optional[str]]:
+        """Export messages from the main table, then partitions oldest first"""
+        if table != "messages":
+            return super()._export_sources(table)
+        return self._message_sources()
+
+    def _export_source_table(self, conn: sqlite3.Connection, table: str,
+                             source: Optional[str]) -> Optional[str]:
+        schema = self._source_schema(conn, source)
+        return None if schema is None else f"{schema}.{table}"
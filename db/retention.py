@@ -0,0 +1,64 @@
+import threading
+from typing import Any, Callable, Dict, Optional
+
+class RetentionJob:
+    """Background thread that periodically purges old messages in small chunks
+
+    Wraps DatabaseManager.iter_cleanup_old_messages so that retention never
+    holds the write lock for longer than one chunk; pauses between chunks
+    give live agents a chance to write.
+    """
+    def __init__(self, db: Any, days: int = 30, interval: float = 3600.0,
+                 chunk_size: int = 5000, pause: float = 0.05,
+                 vacuum_pages: Optional[int] = None,
+                 on_chunk: Optional[Callable[[Dict], None]] = None):
+        self.db = db
+        self.days = days
+        self.interval = interval
+        self.chunk_size = chunk_size
+        self.pause = pause
+        self.vacuum_pages = vacuum_pages
+        self.on_chunk = on_chunk
+        self.last_run: Dict[str, Any] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def run_once(self) -> Dict[str, Any]:
+        """Purge expired messages now and return a summary of the run"""
+        summary = {"chunks": 0, "rows": 0, "seconds": 0.0, "max_chunk_seconds": 0.0}
+        for stats in self.db.iter_cleanup_old_messages(
+                self.days, chunk_size=self.chunk_size, pause=self.pause,
+                vacuum_pages=self.vacuum_pages):
+            summary["chunks"] += 1
+            summary["rows"] += stats["rows"]
+            summary["seconds"] += stats["seconds"]
+            summary["max_chunk_seconds"] = max(summary["max_chunk_seconds"], stats["seconds"])
+            if self.on_chunk:
+                self.on_chunk(stats)
+            if self._stop.is_set():
+                break
+        self.last_run = summary
+        return summary
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                summary = self.run_once()
+                print(f"Retention removed {summary['rows']} messages in {summary['chunks']} chunks")
+            except Exception as e:
+                print(f"Error running retention job: {e}")
+            self._stop.wait(self.interval)
+
+    def start(self) -> None:
+        """Start purging in the background every interval seconds"""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="retention", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the background thread after the current chunk"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
@@ -0,0 +1,277 @@
+import functools
+import inspect
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from queue import Empty, Queue
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from database import ConnectionPool, DatabaseManager, apply_migrations, resolve_pragmas
+
+class _Command:
+    __slots__ = ("fn", "future", "transactional", "on_commit")
+
+    def __init__(self, fn: Callable[[sqlite3.Connection], Any], transactional: bool,
+                 on_commit: Optional[Callable[[], None]]):
+        self.fn = fn
+        self.future: Future = Future()
+        self.transactional = transactional
+        self.on_commit = on_commit
+
+class WriterThread:
+    """Owns the only write connection and applies queued commands with group commit
+
+    Commands waiting in the queue are applied together in one BEGIN
+    IMMEDIATE ... COMMIT, each inside its own savepoint so a failing command
+    is rolled back without affecting the rest of the batch. Futures resolve
+    only after the batch has committed. max_delay, if set, holds a batch
+    open briefly so more commands can join it.
+    """
+    def __init__(self, db_path: str, pragmas: Optional[Dict[str, Any]] = None,
+                 timeout: float = 30.0, max_batch: int = 256, max_delay: float = 0.0):
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._pool = ConnectionPool(db_path, size=1, timeout=timeout, pragmas=pragmas)
+        self.connection = self._pool.acquire()
+        self.connection.isolation_level = None  # Transactions are managed explicitly
+        self._queue: Queue = Queue()
+        self._closed = False
+        self._close_lock = threading.Lock()
+        self.stats = {"commands": 0, "batches": 0, "failed": 0, "largest_batch": 0}
+        self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+        self._thread.start()
+
+    def is_writer_thread(self) -> bool:
+        return threading.current_thread() is self._thread
+
+    def submit(self, fn: Callable[[sqlite3.Connection], Any], transactional: bool = True,
+               on_commit: Optional[Callable[[], None]] = None) -> Future:
+        """Queue fn(conn) for the writer thread and return a future for its result
+
+        Non-transactional commands run on their own outside any batch, for
+        work that manages transactions itself (migrations, incremental_vacuum).
+        on_commit runs on the writer thread once the command's batch commits.
+        """
+        command = _Command(fn, transactional, on_commit)
+        with self._close_lock:
+            if self._closed:
+                raise RuntimeError("Writer thread is closed")
+            self._queue.put(command)
+        return command.future
+
+    def _run(self) -> None:
+        held: Optional[_Command] = None
+        while True:
+            command = held if held is not None else self._queue.get()
+            held = None
+            if command is None:
+                return
+            if not command.transactional:
+                self._run_alone(command)
+                continue
+            batch = [command]
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.max_batch:
+                try:
+                    remaining = deadline - time.monotonic()
+                    following = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except Empty:
+                    break
+                if following is None or not following.transactional:
+                    held = following
+                    break
+                batch.append(following)
+            self._commit(batch)
+
+    def _run_alone(self, command: _Command) -> None:
+        if not command.future.set_running_or_notify_cancel():
+            return
+        self.stats["commands"] += 1
+        try:
+            command.future.set_result(command.fn(self.connection))
+        except Exception as e:
+            self.stats["failed"] += 1
+            command.future.set_exception(e)
+
+    def _commit(self, batch: List[_Command]) -> None:
+        """Apply a batch of commands in one transaction, then resolve their futures"""
+        conn = self.connection
+        batch = [command for command in batch if command.future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        outcomes: List[tuple] = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for command in batch:
+                conn.execute("SAVEPOINT command")
+                try:
+                    outcomes.append((True, command.fn(conn)))
+                except Exception as e:
+                    conn.execute("ROLLBACK TO command")
+                    outcomes.append((False, e))
+                conn.execute("RELEASE command")
+            conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            self.stats["failed"] += len(batch)
+            for command in batch:
+                command.future.set_exception(e)
+            return
+        self.stats["commands"] += len(batch)
+        self.stats["batches"] += 1
+        self.stats["largest_batch"] = max(self.stats["largest_batch"], len(batch))
+        for command, (ok, value) in zip(batch, outcomes):
+            if not ok:
+                self.stats["failed"] += 1
+                command.future.set_exception(value)
+                continue
+            if command.on_commit:
+                command.on_commit()
+            command.future.set_result(value)
+
+    def close(self) -> None:
+        """Apply every queued command, then stop the thread and close the connection"""
+        with self._close_lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(None)
+        self._thread.join()
+        self._pool.release(self.connection)
+        self._pool.close()
+
+# Write methods that return a Future on SerializedDatabaseManager. The rest
+# are overridden there: migrations manage their own transactions and cleanup
+# submits one command per chunk, so those still run synchronously.
+QUEUED_METHODS = tuple(name for name in DatabaseManager.WRITE_METHODS
+                       if name not in ("migrate", "cleanup_old_messages", "iter_cleanup_old_messages"))
+
+# Write methods that change agent rows and the argument naming the agents
+AGENT_WRITES = {
+    "create_agent": "agent_id",
+    "update_agent_state": "agent_id",
+    "patch_agent_state": "agent_id",
+    "update_agent_states": "states",
+    "touch_agents": "activity",
+}
+
+def _write_method(name: str) -> Callable[..., Future]:
+    method = getattr(DatabaseManager, name)
+    signature = inspect.signature(method)
+
+    @functools.wraps(method)
+    def submit(self: "SerializedDatabaseManager", *args: Any, **kwargs: Any) -> Future:
+        on_commit = None
+        if name in AGENT_WRITES:
+            agents = signature.bind(self, *args, **kwargs).arguments[AGENT_WRITES[name]]
+            agent_ids = (agents,) if isinstance(agents, str) else tuple(agents)
+            # Invalidate again after commit: a reader could have cached the old
+            # row between the method's own invalidation and the batch commit
+            on_commit = functools.partial(self.agent_cache.invalidate, *agent_ids)
+        # The method reaches the writer connection through get_connection()
+        return self.writer.submit(lambda conn: method(self, *args, **kwargs), on_commit=on_commit)
+
+    submit.__doc__ = f"{method.__doc__}; queued on the writer thread, returns a Future"
+    return submit
+
+class SerializedDatabaseManager(DatabaseManager):
+    """DatabaseManager with one writer thread and a pool of read-only connections
+
+    Every write method is queued to a single WriterThread and returns a
+    concurrent.futures.Future for the method's usual result, so writers never
+    contend for SQLite's write lock and concurrent writes are group-committed.
+    Reads run on pooled connections opened with query_only, which in WAL mode
+    never block or are blocked by the writer.
+    """
+    def __init__(self, db_path: str = "db/test.db", readers: int = 4,
+                 profile: str = "throughput", pragmas: Optional[Dict[str, Any]] = None,
+                 auto_migrate: bool = True, max_batch: int = 256, max_delay: float = 0.0,
+                 pool_timeout: float = 30.0, **kwargs: Any):
+        # The writer connects first so it sets up WAL before any reader opens
+        self.writer = WriterThread(db_path, resolve_pragmas(profile, pragmas), timeout=pool_timeout,
+                                   max_batch=max_batch, max_delay=max_delay)
+        super().__init__(db_path, pool_size=readers, pool_timeout=pool_timeout, profile=profile,
+                         pragmas={**(pragmas or {}), "query_only": "ON"}, auto_migrate=False,
+                         **kwargs)
+        if auto_migrate:
+            self.migrate()
+
+    def close(self) -> None:
+        """Finish queued writes, then close the writer and reader connections"""
+        self.writer.close()
+        super().close()
+
+    def submit(self, fn: Callable[[sqlite3.Connection], Any]) -> Future:
+        """Run fn(conn) on the writer connection as part of the next group commit"""
+        return self.writer.submit(fn)
+
+    def migrate(self, target: Optional[int] = None) -> int:
+        """Apply pending migrations on the writer connection and return the new version"""
+        return self.writer.submit(functools.partial(apply_migrations, target=target),
+                                  transactional=False).result()
+
+    @contextmanager
+    def get_connection(self, immediate: bool = False) -> Iterator[sqlite3.Connection]:
+        """On the writer thread, scope a command in a savepoint; elsewhere borrow a read-only connection
+
+        immediate is ignored: the writer already holds the write lock for the
+        whole batch, and read-only connections must never take it.
+        """
+        if not self.writer.is_writer_thread():
+            with self.pool.connection() as conn:
+                with conn:
+                    yield conn
+            return
+        conn = self.writer.connection
+        conn.execute("SAVEPOINT scope")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK TO scope")
+            conn.execute("RELEASE scope")
+            raise
+        conn.execute("RELEASE scope")
+
+    def iter_cleanup_old_messages(self, days: int = 30, chunk_size: int = 5000,
+                                  pause: float = 0.01,
+                                  vacuum_pages: Optional[int] = None) -> Iterator[Dict]:
+        """Delete messages older than X days, submitting one writer command per chunk
+
+        Runs on the caller's thread and waits for each chunk, so other writes
+        interleave between chunks instead of queueing behind the whole purge.
+        """
+        with self.pool.connection() as conn:
+            cutoff = self._execute(conn, "cleanup_cutoff", (f'-{days}',), fetch="one")[0]
+        chunk = 0
+        while True:
+            started = time.perf_counter()
+            step = self.writer.submit(
+                functools.partial(self._cleanup_chunk, cutoff=cutoff, chunk_size=chunk_size)
+            ).result()
+            if step is None:
+                return
+            first_id, last_id, deleted = step
+            if vacuum_pages is not None:
+                self.writer.submit(functools.partial(self._incremental_vacuum, pages=vacuum_pages),
+                                   transactional=False).result()
+            chunk += 1
+            yield {
+                "chunk": chunk,
+                "rows": deleted,
+                "first_id": first_id,
+                "last_id": last_id,
+                "seconds": time.perf_counter() - started,
+            }
+            if pause:
+                time.sleep(pause)
+
+    def stats(self) -> Dict[str, Any]:
+        """DatabaseManager.stats() plus writer queue and group commit counters"""
+        return {**super().stats(), "writer": {**self.writer.stats, "queued": self.writer._queue.qsize()}}
+
+for _name in QUEUED_METHODS:
+    setattr(SerializedDatabaseManager, _name, _write_method(_name))
+del _name
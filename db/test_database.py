@@ -1,5 +1,20 @@
-from database import DatabaseManager
+from database import DatabaseManager, MIGRATIONS, PRAGMA_PROFILES, VersionConflictError
+from write_behind import WriteBehindBuffer, WriteBehindError
+from backup import BackupManager
+from partitions import PARTITION_SCHEMA, PartitionedDatabaseManager
+from benchmark import run_benchmark
+from serialized import SerializedDatabaseManager
+from async_database import AsyncDatabaseManager
+from heartbeat import HeartbeatTracker
+from datetime import date, timedelta
+import asyncio
 import json
+import sqlite3
+import os
+import tempfile
+import threading
+import time
+import csv
 
 def test_database_functions():
     print("Starting database tests...")
@@ -49,5 +64,563 @@ def test_database_functions():
     remaining_messages = db.get_agent_messages("test_agent_1")
     print(f"Messages remaining: {len(remaining_messages)}")
 
+def test_connection_pool():
+    print("\nTesting connection pool reuse:")
+    db_path = os.path.join(tempfile.mkdtemp(), "pool.db")
+    db = DatabaseManager(db_path, pool_size=2)
+
+    def worker(seen):
+        for _ in range(50):
+            with db.get_connection() as conn:
+                seen.add(id(conn))
+
+    seen = set()
+    threads = [threading.Thread(target=worker, args=(seen,)) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    print(f"Distinct connections used: {len(seen)}, pool stats: {db.pool.stats()}")
+    assert len(seen) <= 2
+
+    db.close()
+    print(f"Pool stats after close: {db.pool.stats()}")
+    assert db.pool.stats()["open"] == 0
+
+def test_pragma_profiles():
+    print("\nTesting pragma profiles:")
+    for profile in PRAGMA_PROFILES:
+        db_path = os.path.join(tempfile.mkdtemp(), "pragmas.db")
+        with DatabaseManager(db_path, profile=profile) as db:
+            with db.get_connection() as conn:
+                journal_mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+                synchronous = conn.execute("PRAGMA synchronous").fetchone()[0]
+        print(f"{profile}: journal_mode={journal_mode}, synchronous={synchronous}")
+        assert journal_mode.upper() == PRAGMA_PROFILES[profile]["journal_mode"]
+
+def test_schema_migrations():
+    print("\nTesting schema migrations:")
+    db_path = os.path.join(tempfile.mkdtemp(), "schema.db")
+    with DatabaseManager(db_path) as db:
+        version = db.schema_version()
+        print(f"Schema version: {version}")
+        assert version == MIGRATIONS[-1][0]
+        with db.get_connection() as conn:
+            indexes = {row["name"] for row in conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'messages'")}
+        print(f"Message indexes: {sorted(indexes)}")
+        assert "idx_messages_receiver_ts" in indexes
+
+    # Re-opening an up-to-date database must be a no-op
+    with DatabaseManager(db_path) as db:
+        assert db.schema_version() == version
+
+def test_store_messages():
+    print("\nTesting bulk message ingestion:")
+    db_path = os.path.join(tempfile.mkdtemp(), "bulk.db")
+    with DatabaseManager(db_path) as db:
+        ids = db.store_messages(
+            (("bulk_agent", "other", f"message {i}") for i in range(2500)), chunk_size=1000)
+        print(f"Inserted {len(ids)} messages, ids {ids[0]}..{ids[-1]}")
+        assert ids == list(range(1, 2501))
+        # Returned ids line up with the stored rows, across chunk boundaries too
+        for message_id in (1, 1000, 1001, 2500):
+            with db.get_connection() as conn:
+                content = conn.execute("SELECT content FROM messages WHERE id = ?",
+                                       (message_id,)).fetchone()[0]
+            assert content == f"message {message_id - 1}"
+        assert db.store_messages([]) == []
+
+def test_write_behind():
+    print("\nTesting write-behind buffer:")
+    db_path = os.path.join(tempfile.mkdtemp(), "write_behind.db")
+    with DatabaseManager(db_path) as db:
+        db.create_agent("agent", "answer", "mistral")
+        with WriteBehindBuffer(db, batch_size=100, max_pending=200) as buffer:
+            for i in range(500):
+                buffer.store_message("other", "agent", f"reply {i}")
+            buffer.update_agent_state("agent", {"step": 1})
+            buffer.update_agent_state("agent", {"step": 2})
+            buffer.flush()
+            print(f"Buffer stats: {buffer.stats}")
+        assert json.loads(db.get_agent("agent")["state"]) == {"step": 2}
+        assert len(db.get_agent_messages("agent", limit=5000)) == 500
+
+        print("Testing failed flushes are retried, not dropped:")
+        with db.get_connection() as conn:
+            conn.execute("CREATE TRIGGER reject_messages BEFORE INSERT ON messages "
+                         "BEGIN SELECT RAISE(ABORT, 'simulated failure'); END")
+        buffer = WriteBehindBuffer(db, batch_size=200, flush_interval=60, max_pending=300)
+        for i in range(150):
+            buffer.store_message("other", "agent", f"retry {i}")
+        try:
+            buffer.flush()
+            assert False, "Expected WriteBehindError"
+        except WriteBehindError as e:
+            print(f"Flush failed as expected: {e}")
+        assert buffer.stats["requeued"] == 150 and buffer.stats["dropped"] == 0
+        with db.get_connection() as conn:
+            conn.execute("DROP TRIGGER reject_messages")
+        buffer.close()
+        assert len(db.get_agent_messages("agent", limit=5000)) == 650
+
+def test_iter_agent_messages():
+    print("\nTesting keyset message iteration:")
+    db_path = os.path.join(tempfile.mkdtemp(), "keyset.db")
+    with DatabaseManager(db_path) as db:
+        db.store_messages((("bulk_agent", "other", f"message {i}") for i in range(2500)), chunk_size=1000)
+        db.store_messages((("other", "bulk_agent", f"reply {i}") for i in range(500)))
+        streamed = [row["id"] for row in db.iter_agent_messages("bulk_agent", batch_size=128)]
+        print(f"Streamed {len(streamed)} messages in order")
+        assert streamed == sorted(streamed) and len(streamed) == 3000
+
+def test_work_queue():
+    print("\nTesting claimable work queue:")
+    db_path = os.path.join(tempfile.mkdtemp(), "queue.db")
+    with DatabaseManager(db_path) as db:
+        db.store_messages([("producer", "worker", f"job {i}") for i in range(10)])
+
+        first = db.claim_messages("worker", n=4, lease_seconds=60)
+        second = db.claim_messages("worker", n=4, lease_seconds=60)
+        print(f"Claimed {[m['id'] for m in first]} and {[m['id'] for m in second]}")
+        assert not {m["id"] for m in first} & {m["id"] for m in second}
+
+        assert db.ack_messages([m["id"] for m in first]) == 4
+
+        # An expired lease makes the message claimable again
+        crashed = db.claim_messages("worker", n=2, lease_seconds=0)
+        redelivered = db.claim_messages("worker", n=2, lease_seconds=60)
+        print(f"Redelivered after lease expiry: {[m['id'] for m in redelivered]}")
+        assert [m["id"] for m in redelivered] == [m["id"] for m in crashed]
+
+def test_chunked_cleanup():
+    print("\nTesting chunked retention cleanup:")
+    db_path = os.path.join(tempfile.mkdtemp(), "retention.db")
+    with DatabaseManager(db_path) as db:
+        db.store_messages([("old", "agent", f"old {i}") for i in range(250)])
+        db.store_messages([("new", "agent", f"new {i}") for i in range(50)])
+        with db.get_connection() as conn:
+            conn.execute("UPDATE messages SET timestamp = '2000-01-01 00:00:00' WHERE sender_id = 'old'")
+
+        chunks = list(db.iter_cleanup_old_messages(days=1, chunk_size=100, pause=0, vacuum_pages=0))
+        for chunk in chunks:
+            print(f"Chunk {chunk['chunk']}: {chunk['rows']} rows in {chunk['seconds']:.4f}s")
+        assert sum(chunk["rows"] for chunk in chunks) == 250
+        assert len(db.get_agent_messages("agent", limit=1000)) == 50
+
+    # Timestamps need not follow ids (backfills, imported history)
+    with DatabaseManager(os.path.join(tempfile.mkdtemp(), "out_of_order.db")) as db:
+        ids = db.store_messages([("sender", "agent", f"message {i}") for i in range(10)])
+        with db.get_connection() as conn:
+            conn.execute("UPDATE messages SET timestamp = '2000-01-01 00:00:00' WHERE id > ?", (ids[0],))
+        assert db.cleanup_old_messages(days=1, chunk_size=4)
+        remaining = db.get_agent_messages("agent", limit=100)
+        print(f"Out-of-order cleanup kept ids {[row['id'] for row in remaining]}")
+        assert [row["id"] for row in remaining] == [ids[0]]
+
+def test_agent_cache():
+    print("\nTesting agent cache:")
+    db_path = os.path.join(tempfile.mkdtemp(), "cache.db")
+    with DatabaseManager(db_path, agent_cache_size=2) as db:
+        db.create_agent("cached_agent", "question", "mistral")
+        db.get_agent("cached_agent")
+        db.get_agent("cached_agent")
+        db.update_agent_state("cached_agent", {"turn": 1})
+        agent = db.get_agent("cached_agent")
+        print(f"Cache stats: {db.agent_cache.stats()}")
+        assert json.loads(agent["state"]) == {"turn": 1}
+        assert db.agent_cache.stats()["hits"] == 1
+
+def test_patch_agent_state():
+    print("\nTesting optimistic state patches:")
+    db_path = os.path.join(tempfile.mkdtemp(), "patch.db")
+    with DatabaseManager(db_path) as db:
+        db.create_agent("patched_agent", "answer", "mistral")
+        db.update_agent_state("patched_agent", {"answers": 1, "topic": "python"})
+        version = db.get_agent("patched_agent")["version"]
+
+        new_version = db.patch_agent_state("patched_agent", {"answers": 2, "topic": None},
+                                           expected_version=version)
+        state = json.loads(db.get_agent("patched_agent")["state"])
+        print(f"Patched to version {new_version}: {state}")
+        assert state == {"answers": 2}
+
+        try:
+            db.patch_agent_state("patched_agent", {"answers": 3}, expected_version=version)
+            assert False, "stale patch should conflict"
+        except VersionConflictError as e:
+            print(f"Test passed: {e}")
+
+def test_search_messages():
+    print("\nTesting full-text message search:")
+    db_path = os.path.join(tempfile.mkdtemp(), "search.db")
+    with DatabaseManager(db_path) as db:
+        db.store_messages([
+            ("questioner", "answerer", "What are Python decorators used for?", "question"),
+            ("answerer", "questioner", "Decorators wrap a function to extend its behaviour.", "answer"),
+            ("questioner", "other", "How does garbage collection work?", "question"),
+        ])
+        results = db.search_messages("decorator*")
+        for result in results:
+            print(f"{result['rank']:.3f} {result['snippet']}")
+        assert len(results) == 2
+        assert sorted(result["snippet"] for result in results) == [
+            "What are Python [decorators] used for?", "[Decorators] wrap a function to extend its behaviour."]
+        # The index is contentless: no second copy of the message text
+        with db.get_connection() as conn:
+            assert not conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'messages_fts_content'").fetchone()
+
+        assert len(db.search_messages("garbage", agent_id="answerer")) == 0
+        with db.get_connection() as conn:
+            conn.execute("UPDATE messages SET timestamp = '2000-01-01 00:00:00'")
+        db.cleanup_old_messages(days=1)
+        assert db.search_messages("decorator*") == []
+        assert db.optimize_search_index(rebuild=True)
+
+def test_compression():
+    print("\nTesting transparent compression:")
+    db_path = os.path.join(tempfile.mkdtemp(), "compressed.db")
+    with DatabaseManager(db_path, compression="zlib", compression_threshold=256) as db:
+        answer = "Python decorators wrap functions to add behaviour. " * 40
+        db.create_agent("verbose_agent", "answer", "mistral")
+        db.store_message("verbose_agent", "questioner", answer, "answer")
+        db.update_agent_state("verbose_agent", {"history": [answer] * 5})
+
+        with db.get_connection() as conn:
+            stored = conn.execute("SELECT length(content) AS size, codec FROM messages").fetchone()
+        print(f"Stored {len(answer)} characters as {stored['size']} bytes ({stored['codec']})")
+        assert stored["codec"] == "zlib" and stored["size"] < len(answer)
+
+        assert db.get_agent_messages("verbose_agent")[0]["content"] == answer
+        assert json.loads(db.get_agent("verbose_agent")["state"]) == {"history": [answer] * 5}
+        assert db.search_messages("decorators")[0]["content"] == answer
+
+    # The schema needs no DatabaseManager functions, so other tools can write
+    # to it even with trusted_schema off; a rebuild indexes their rows
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA trusted_schema = OFF")
+    with conn:
+        conn.execute("INSERT INTO messages (sender_id, receiver_id, content) "
+                     "VALUES ('cli', 'verbose_agent', 'Written by another tool')")
+    conn.close()
+    with DatabaseManager(db_path, compression="zlib", compression_threshold=256) as db:
+        assert db.search_messages("tool") == []
+        assert db.optimize_search_index(rebuild=True)
+        assert len(db.search_messages("tool")) == 1
+        assert db.search_messages("decorators")[0]["content"] == answer
+        assert db.search_messages("decorators")[0]["snippet"] == (
+            "Python [decorators] wrap functions to add behaviour. Python [decorators] wrap functions to...")
+
+        # Retention unindexes compressed rows by their decompressed text
+        with db.get_connection() as conn:
+            conn.execute("UPDATE messages SET timestamp = '2000-01-01 00:00:00'")
+        assert db.cleanup_old_messages(days=1)
+        assert db.search_messages("decorators") == [] and db.search_messages("tool") == []
+
+def test_hot_backup():
+    print("\nTesting online backups:")
+    workdir = tempfile.mkdtemp()
+    db_path = os.path.join(workdir, "live.db")
+    with DatabaseManager(db_path) as db:
+        db.store_messages([("agent", "other", f"message {i}") for i in range(1000)])
+        manager = BackupManager(db_path, os.path.join(workdir, "backups"), pages=8, keep=2)
+        reports = [manager.run() for _ in range(3)]
+        manager.compress = True
+        reports.append(manager.run())
+        for report in reports:
+            print(f"{report['path']}: {report['steps']} steps, {report['mb_per_second']:.1f} MB/s")
+        assert len(manager.list_backups()) == 2
+        assert reports[-1]["path"].endswith(".gz")
+
+        restored_path = os.path.join(workdir, "restored.db")
+        BackupManager.restore(reports[-1]["path"], restored_path)
+        with DatabaseManager(restored_path) as restored:
+            assert len(restored.get_agent_messages("agent", limit=5000)) == 1000
+
+def test_partitioned_messages():
+    print("\nTesting time-partitioned message storage:")
+    workdir = tempfile.mkdtemp()
+    # Messages written before partitioning stay in the main table
+    with DatabaseManager(os.path.join(workdir, "main.db")) as db:
+        db.store_messages([("agent", "other", f"legacy {i}") for i in range(3)])
+    with PartitionedDatabaseManager(os.path.join(workdir, "main.db")) as db:
+        today = db.store_messages([("agent", "other", f"today {i}") for i in range(5)])
+
+        # Backfill an old partition directly to simulate earlier days
+        old_key = (date.today() - timedelta(days=40)).isoformat()
+        with db.pool.connection() as conn:
+            schema = db._attach(conn, old_key, create=True)
+            with conn:
+                conn.execute(f"INSERT INTO {schema}.messages (sender_id, receiver_id, content, timestamp) "
+                             "VALUES ('agent', 'other', 'ancient', ?)", (f"{old_key} 12:00:00",))
+            journal_mode = conn.execute(f"PRAGMA {schema}.journal_mode").fetchone()[0]
+        assert journal_mode == "wal"
+
+        messages = db.get_agent_messages("agent", limit=10)
+        print(f"Partitions: {db.partitions()}, merged messages: {len(messages)}")
+        assert len(messages) == 9 and messages[-1]["content"].startswith("legacy")
+        streamed = [row["content"] for row in db.iter_agent_messages("agent", batch_size=2)]
+        assert streamed == [f"legacy {i}" for i in range(3)] + ["ancient"] + [f"today {i}" for i in range(5)]
+        assert len(db.search_messages("today")) == 5 and len(db.search_messages("legacy")) == 3
+
+        # The work queue spans the main table and partitions, oldest first
+        claimed = db.claim_messages("other", n=4)
+        assert [row["content"] for row in claimed] == [f"legacy {i}" for i in range(3)] + ["ancient"]
+        assert db.ack_messages(row["id"] for row in claimed) == 4
+        assert [row["id"] for row in db.claim_messages("other", n=10)] == today
+        assert db.release_messages(today) == 5
+
+        csv_path = os.path.join(workdir, "messages.csv")
+        assert db.export_table("messages", csv_path, format="csv")["rows"] == 9
+
+        dropped = list(db.iter_cleanup_old_messages(days=30, pause=0))
+        print(f"Retention: {dropped}, partitions left: {db.partitions()}")
+        assert [(chunk["partition"], chunk["rows"]) for chunk in dropped] == [(old_key, 1)]
+        assert old_key not in db.partitions()
+        assert len(db.get_agent_messages("agent", limit=10)) == 8
+
+def test_many_partitions():
+    print("\nTesting more partitions than SQLite can attach at once:")
+    workdir = tempfile.mkdtemp()
+    with PartitionedDatabaseManager(os.path.join(workdir, "main.db"), pool_size=1) as db:
+        days = [(date.today() - timedelta(days=day)).isoformat() for day in range(15)]
+        with db.pool.connection() as conn:
+            for key in days:
+                schema = db._attach(conn, key, create=True)
+                with conn:
+                    message_id = conn.execute(
+                        f"INSERT INTO {schema}.messages (sender_id, receiver_id, content, timestamp) "
+                        "VALUES ('agent', 'other', ?, ?)", (f"day {key}", f"{key} 12:00:00")).lastrowid
+                    conn.execute(f"INSERT INTO {schema}.messages_fts (rowid, content) VALUES (?, ?)",
+                                 (message_id, f"day {key}"))
+            attached = [row[1] for row in conn.execute("PRAGMA database_list") if row[1].startswith("p_")]
+        print(f"{len(db.partitions())} partitions, at most {len(attached)} attached")
+        assert len(db.partitions()) == 15 and len(attached) < 15
+
+        assert len(db.get_agent_messages("agent", limit=100)) == 15
+        assert len(list(db.iter_agent_messages("agent", batch_size=4))) == 15
+        assert len(db.search_messages("day", limit=100)) == 15
+        assert db.optimize_search_index(rebuild=True)
+        assert len(db.search_messages("day", limit=100)) == 15
+        claimed = db.claim_messages("other", n=100)
+        assert [row["content"] for row in claimed] == [f"day {key}" for key in reversed(days)]
+        assert db.ack_messages(row["id"] for row in claimed) == 15
+
+    # Partitions written before the search index was contentless are reindexed on attach
+    legacy_dir = os.path.join(workdir, "legacy_partitions")
+    os.makedirs(legacy_dir)
+    legacy = sqlite3.connect(os.path.join(legacy_dir, f"messages-day-{date.today().isoformat()}.db"))
+    with legacy:
+        for statement in PARTITION_SCHEMA[:-1]:
+            legacy.execute(statement.format(schema="main"))
+        legacy.execute("CREATE VIRTUAL TABLE messages_fts USING fts5(content)")
+        legacy.execute("INSERT INTO messages (sender_id, receiver_id, content) VALUES ('agent', 'other', 'legacy')")
+        legacy.execute("INSERT INTO messages_fts (rowid, content) VALUES (1, 'legacy')")
+    legacy.close()
+    with PartitionedDatabaseManager(os.path.join(workdir, "legacy.db")) as db:
+        assert [row["snippet"] for row in db.search_messages("legacy")] == ["[legacy]"]
+        with db.pool.connection() as conn:
+            schema = db._attach(conn, date.today().isoformat())
+            assert "content=''" in conn.execute(
+                f"SELECT sql FROM {schema}.sqlite_master WHERE name = 'messages_fts'").fetchone()[0]
+
+def test_export():
+    print("\nTesting chunked table export:")
+    workdir = tempfile.mkdtemp()
+    with DatabaseManager(os.path.join(workdir, "export.db"), compression="zlib",
+                         compression_threshold=64) as db:
+        db.store_messages([("agent", "other", f"answer {i} " * 20) for i in range(1200)])
+        csv_path = os.path.join(workdir, "messages.csv")
+        report = db.export_table("messages", csv_path, format="csv",
+                                 columns=["id", "content"], chunk_size=500)
+        print(f"Exported {report['rows']} rows in {report['batches']} batches")
+        with open(csv_path, newline="", encoding="utf-8") as handle:
+            rows = list(csv.reader(handle))
+        assert rows[0] == ["id", "content"] and len(rows) == 1201
+        assert rows[1][1] == "answer 0 " * 20
+
+def test_query_stats():
+    print("\nTesting query statistics:")
+    workdir = tempfile.mkdtemp()
+    # A zero threshold logs every statement as slow, with its query plan
+    with DatabaseManager(os.path.join(workdir, "stats.db"), slow_query_ms=0) as db:
+        db.create_agent("agent", "test", "llama2")
+        db.store_messages([("agent", "other", f"message {i}") for i in range(20)])
+        db.get_agent_messages("agent", limit=5)
+        db.create_agent("agent", "test", "llama2")  # Duplicate key counts as an error
+        stats = db.stats()
+        statements = stats["statements"]
+        print(f"Recorded {len(statements)} statements, {len(stats['slow_queries'])} slow queries")
+        assert statements["store_message"]["rows"] == 20
+        assert statements["get_agent_messages"]["rows"] == 5
+        assert statements["create_agent"]["calls"] == 2 and statements["create_agent"]["errors"] == 1
+        slow = [q for q in stats["slow_queries"] if q["name"] == "get_agent_messages"]
+        assert slow and any("idx_messages" in step for step in slow[0]["plan"])
+
+def test_benchmark():
+    print("\nTesting benchmark suite:")
+    result = run_benchmark(1000, "throughput", samples=20, workdir=tempfile.mkdtemp())
+    for name, stats in result["benchmarks"].items():
+        print(f"{name}: {stats['ops_per_sec']:.0f} ops/s, p99 {stats['p99_ms']:.3f} ms")
+    assert set(result["benchmarks"]) == {"store_message", "get_agent_messages", "get_active_agents",
+                                         "update_agent_state", "concurrent_reads", "concurrent_writes",
+                                         "cleanup_old_messages"}
+    assert result["benchmarks"]["concurrent_reads"]["calls"] == 4 * 20
+    # Half of the 60-day synthetic history is past the 30-day retention
+    assert 400 <= result["benchmarks"]["cleanup_old_messages"]["rows_deleted"] <= 600
+
+def test_serialized_writer():
+    print("\nTesting serialized writer:")
+    workdir = tempfile.mkdtemp()
+    with SerializedDatabaseManager(os.path.join(workdir, "serialized.db"), readers=4) as db:
+        assert db.create_agent("agent", "test", "llama2").result()
+        futures = []
+
+        def write(worker):
+            for i in range(200):
+                futures.append(db.store_message("agent", "other", f"{worker}-{i}"))
+
+        threads = [threading.Thread(target=write, args=(worker,)) for worker in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert all(future.result() for future in futures)
+        assert len(db.get_agent_messages("agent", limit=2000)) == 1600
+
+        assert db.update_agent_state("agent", {"step": 1}).result()
+        assert json.loads(db.get_agent("agent")["state"]) == {"step": 1}
+        try:
+            db.patch_agent_state("agent", {"step": 2}, expected_version=0).result()
+            assert False, "Expected a version conflict"
+        except VersionConflictError:
+            pass
+
+        db.submit(lambda conn: conn.execute(
+            "UPDATE messages SET timestamp = '2000-01-01 00:00:00' WHERE id <= 100")).result()
+        assert sum(chunk["rows"] for chunk in db.iter_cleanup_old_messages(1, chunk_size=40, pause=0)) == 100
+
+        # Buffering helpers wait on the writer's Futures instead of treating them as results
+        with WriteBehindBuffer(db, batch_size=50, flush_interval=60) as buffer:
+            for i in range(120):
+                buffer.store_message("other", "agent", f"buffered {i}")
+            buffer.update_agent_state("agent", {"step": 3})
+        assert buffer.stats["messages_flushed"] == 120 and buffer.stats["states_flushed"] == 1
+        assert json.loads(db.get_agent("agent")["state"]) == {"step": 3}
+        with HeartbeatTracker(db, flush_interval=60) as tracker:
+            tracker.touch("agent")
+            tracker.flush()
+            assert tracker.stats["rows_flushed"] == 1
+
+        # Reader connections are query_only, so writes must go through the writer
+        with db.get_connection() as conn:
+            try:
+                conn.execute("DELETE FROM messages")
+                assert False, "Expected a read-only error"
+            except sqlite3.OperationalError:
+                pass
+        stats = db.stats()["writer"]
+        print(f"{stats['commands']} commands in {stats['batches']} batches, largest {stats['largest_batch']}")
+        assert stats["batches"] < stats["commands"]
+
+def test_heartbeat():
+    print("\nTesting heartbeat tracker:")
+    db_path = os.path.join(tempfile.mkdtemp(), "heartbeat.db")
+    with DatabaseManager(db_path) as db:
+        for agent_id in ("busy", "quiet", "idle"):
+            db.create_agent(agent_id, "answer", "mistral")
+        db.touch_agents({agent_id: time.time() - 7200 for agent_id in ("busy", "quiet", "idle")})
+        with HeartbeatTracker(db, flush_interval=60) as tracker:
+            for _ in range(100):
+                tracker.touch("busy")
+            tracker.touch("quiet")
+            calls = db.stats()["statements"]["touch_agents"]["calls"]
+            tracker.flush()
+            print(f"Tracker stats after flush: {tracker.stats}")
+            # 101 touches coalesce into one batched UPDATE of two rows
+            assert tracker.stats["rows_flushed"] == 2 and tracker.stats["flushes"] == 1
+            assert db.stats()["statements"]["touch_agents"]["calls"] == calls + 1
+
+            tracker.touch("idle")  # Not flushed yet, but visible from memory
+            active = {row["agent_id"] for row in tracker.get_active_agents(60)}
+            assert active == {"busy", "quiet", "idle"}
+            assert tracker.stats["served_from_memory"] == 1
+            # A window wider than the snapshot's goes to the database
+            tracker.get_active_agents(24 * 60)
+            assert tracker.stats["served_from_db"] == 1
+        print(f"Tracker stats after close: {tracker.stats}")
+        assert {row["agent_id"] for row in db.get_active_agents(60)} == {"busy", "quiet", "idle"}
+
+def test_async_database():
+    print("\nTesting async database manager:")
+
+    async def run(db_path):
+        async with AsyncDatabaseManager(db_path, readers=2) as db:
+            assert await db.create_agent("agent", "answer", "mistral")
+            results = await asyncio.gather(*(db.store_message("other", "agent", f"message {i}")
+                                             for i in range(50)))
+            assert all(results)
+            agent = await db.get_agent("agent")
+            recent = await db.get_agent_messages("agent", limit=5)
+            streamed = [row["id"] async for row in db.iter_agent_messages("agent", batch_size=16)]
+            # Generator methods are proxied as async generators
+            exported = [len(rows) async for _, rows in db.iter_table_chunks("messages", chunk_size=20)]
+            with db.db.get_connection() as conn:
+                conn.execute("UPDATE messages SET timestamp = '2000-01-01 00:00:00'")
+            purged = [chunk["rows"] async for chunk in db.iter_cleanup_old_messages(1, chunk_size=20, pause=0)]
+
+            # Cancel while the next step (here the pause between chunks) runs on the executor
+            await db.store_messages([("other", "agent", f"old {i}") for i in range(50)])
+            with db.db.get_connection() as conn:
+                conn.execute("UPDATE messages SET timestamp = '2000-01-01 00:00:00'")
+            first_chunk = asyncio.Event()
+
+            async def purge():
+                async for _ in db.iter_cleanup_old_messages(1, chunk_size=20, pause=0.3):
+                    first_chunk.set()
+
+            task = asyncio.create_task(purge())
+            await first_chunk.wait()
+            await asyncio.sleep(0.05)
+            task.cancel()
+            try:
+                await task
+                assert False, "Expected the purge to be cancelled"
+            except asyncio.CancelledError:
+                pass
+            # The step in flight finished its chunk, then the generator was closed
+            remaining = len(await db.get_agent_messages("agent", limit=100))
+            return agent, recent, streamed, exported, purged, remaining
+
+    agent, recent, streamed, exported, purged, remaining = asyncio.run(run(os.path.join(tempfile.mkdtemp(), "async.db")))
+    print(f"Read agent {agent['agent_id']}, streamed {len(streamed)} messages, "
+          f"exported chunks {exported}, purged chunks {purged}")
+    assert agent["model"] == "mistral" and len(recent) == 5
+    assert streamed == sorted(streamed) and len(streamed) == 50
+    assert exported == [20, 20, 10] and purged == [20, 20, 10]
+    assert remaining == 10
+
 if __name__ == "__main__":
     test_database_functions()
+    test_connection_pool()
+    test_pragma_profiles()
+    test_schema_migrations()
+    test_store_messages()
+    test_write_behind()
+    test_iter_agent_messages()
+    test_work_queue()
+    test_chunked_cleanup()
+    test_agent_cache()
+    test_patch_agent_state()
+    test_search_messages()
+    test_compression()
+    test_hot_backup()
+    test_partitioned_messages()
+    test_many_partitions()
+    test_export()
+    test_query_stats()
+    test_benchmark()
+    test_serialized_writer()
+    test_heartbeat()
+    test_async_database()
@@ -0,0 +1,186 @@
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from database import resolve
+
+class WriteBehindError(sqlite3.Error):
+    """Raised by flush() and close() when buffered writes could not be stored"""
+    pass
+
+class WriteBehindBuffer:
+    """Buffers message and agent state writes in memory and flushes them to a DatabaseManager in batches
+
+    Messages are written with store_messages and agent states with
+    update_agent_states; repeated state updates for the same agent are
+    coalesced so only the latest one reaches the database. Callers block once
+    max_pending writes are waiting, which bounds memory under sustained load.
+
+    Writes that fail are put back in the buffer, as far as max_pending
+    allows, to be retried on the next flush; flush() and close() raise
+    WriteBehindError whenever a write failed, reporting any that were dropped.
+    db may also be a SerializedDatabaseManager; its Futures are waited on.
+    """
+    def __init__(self, db: Any, batch_size: int = 500, flush_interval: float = 0.5,
+                 max_pending: int = 10000):
+        if max_pending < batch_size:
+            raise ValueError("max_pending must be at least batch_size")
+        self.db = db
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._messages: List[Tuple[str, str, str, str]] = []
+        self._states: Dict[str, Dict] = {}
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._closed = False
+        self.stats = {"messages_flushed": 0, "states_flushed": 0, "flushes": 0, "failed": 0,
+                      "requeued": 0, "dropped": 0}
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+
+    def __enter__(self) -> "WriteBehindBuffer":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def _pending(self) -> int:
+        return len(self._messages) + len(self._states)
+
+    def _wait_for_room(self, timeout: Optional[float]) -> bool:
+        """Block until the buffer has room; caller must hold the condition"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._pending() >= self.max_pending and not self._closed:
+            self._cond.notify_all()  # Wake the flusher so room frees up
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return False
+            self._cond.wait(remaining)
+        return not self._closed
+
+    def store_message(self, sender_id: str, receiver_id: str, content: str,
+                      message_type: str = 'general', timeout: Optional[float] = None) -> bool:
+        """Queue a message for storage; returns False if the buffer stays full past timeout"""
+        with self._cond:
+            if not self._wait_for_room(timeout):
+                return False
+            self._messages.append((sender_id, receiver_id, content, message_type))
+            if self._pending() >= self.batch_size:
+                self._cond.notify_all()
+            return True
+
+    def update_agent_state(self, agent_id: str, state: Dict,
+                           timeout: Optional[float] = None) -> bool:
+        """Queue an agent state update, replacing any update still waiting for that agent"""
+        with self._cond:
+            if agent_id not in self._states and not self._wait_for_room(timeout):
+                return False
+            self._states[agent_id] = state
+            if self._pending() >= self.batch_size:
+                self._cond.notify_all()
+            return True
+
+    def flush(self) -> None:
+        """Write everything buffered so far before returning
+
+        Raises WriteBehindError if any write failed; failed writes stay
+        buffered for the next flush unless there was no room for them.
+        """
+        with self._flush_lock:
+            with self._cond:
+                messages, self._messages = self._messages, []
+                states, self._states = self._states, {}
+                self._cond.notify_all()  # Release producers blocked on backpressure
+            failed_messages, failed_states = self._write(messages, states)
+            if failed_messages or failed_states:
+                dropped = self._requeue(failed_messages, failed_states)
+                raise WriteBehindError(
+                    f"Failed to write {len(failed_messages)} messages and {len(failed_states)} "
+                    f"agent states; {dropped} dropped because the buffer is full")
+
+    def _write(self, messages: List[Tuple[str, str, str, str]],
+               states: Dict[str, Dict]) -> Tuple[List[Tuple[str, str, str, str]], Dict[str, Dict]]:
+        """Write a batch and return the messages and states that were not stored"""
+        failed_messages: List[Tuple[str, str, str, str]] = []
+        failed_states: Dict[str, Dict] = {}
+        if messages:
+            # store_messages commits whole chunks in order, so the stored ones are a prefix
+            try:
+                stored = len(resolve(self.db.store_messages(messages)))
+            except sqlite3.Error as e:  # A serialized writer's batch failed to commit
+                print(f"Error storing messages: {e}")
+                stored = 0
+            self.stats["messages_flushed"] += stored
+            failed_messages = messages[stored:]
+        if states:
+            try:
+                written = resolve(self.db.update_agent_states(states))
+            except sqlite3.Error as e:
+                print(f"Error updating agent states: {e}")
+                written = False
+            if written:
+                self.stats["states_flushed"] += len(states)
+            else:
+                failed_states = states
+        self.stats["failed"] += len(failed_messages) + len(failed_states)
+        if messages or states:
+            self.stats["flushes"] += 1
+        return failed_messages, failed_states
+
+    def _requeue(self, messages: List[Tuple[str, str, str, str]], states: Dict[str, Dict]) -> int:
+        """Put failed writes back ahead of newer ones within max_pending; returns how many were dropped"""
+        with self._cond:
+            dropped = 0
+            for agent_id, state in states.items():
+                if agent_id in self._states:
+                    continue  # A newer state was queued meanwhile and supersedes this one
+                if self._pending() >= self.max_pending:
+                    dropped += 1
+                    continue
+                self._states[agent_id] = state
+                self.stats["requeued"] += 1
+            room = max(0, self.max_pending - self._pending())
+            self._messages = messages[:room] + self._messages
+            self.stats["requeued"] += min(room, len(messages))
+            dropped += max(0, len(messages) - room)
+            self.stats["dropped"] += dropped
+            return dropped
+
+    def _run(self) -> None:
+        """Flush whenever a batch fills up or flush_interval elapses"""
+        failing = False
+        while True:
+            with self._cond:
+                # Notifications also wake this thread (flush() releasing producers),
+                # so keep waiting until a batch fills or the interval runs out.
+                # After a failure wait out the interval rather than retrying at once
+                deadline = time.monotonic() + self.flush_interval
+                while not self._closed and (failing or self._pending() < self.batch_size):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                closed = self._closed
+            if closed:
+                return  # close() does the final flush and reports its errors
+            try:
+                self.flush()
+                failing = False
+            except WriteBehindError as e:
+                print(f"Error flushing write-behind buffer: {e}")
+                failing = True
+
+    def close(self) -> None:
+        """Stop the background flusher after writing everything still buffered
+
+        Raises WriteBehindError if the final flush fails.
+        """
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+        self.flush()
@@ -0,0 +1,426 @@
+import asyncio
+import json
+import os
+import time
+import weakref
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Union
+
+import httpx
+from pydantic import BaseModel, Field
+
+from response_cache import ResponseCache
+
+OLLAMA_BASE_URL = os.environ.get("OLLAMA_BASE_URL", "http://localhost:11434")
+
+class OllamaStreamError(Exception):
+    """Raised when Ollama reports an error in the middle of a streamed response"""
+    pass
+
+Hook = Callable[["OllamaClientManager"], Awaitable[None]]
+
+class OllamaClientManager:
+    """Process-wide owner of the pooled httpx.AsyncClient that talks to Ollama
+
+    Every agent borrows the same client, so requests reuse kept-alive
+    connections instead of paying TCP setup per call. The client is created
+    lazily on first use and again if the event loop it belongs to has gone
+    away (each asyncio.run() starts a new loop).
+    """
+    def __init__(self, base_url: str = OLLAMA_BASE_URL, timeout: float = 30.0,
+                 max_connections: int = 20, max_keepalive_connections: int = 10,
+                 keepalive_expiry: float = 60.0,
+                 transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.base_url = base_url
+        self.transport = transport  # e.g. httpx.MockTransport in tests
+        self.timeout = httpx.Timeout(timeout)
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self._client: Optional[httpx.AsyncClient] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock: Optional[asyncio.Lock] = None
+        self._startup_hooks: List[Hook] = []
+        self._shutdown_hooks: List[Hook] = []
+        # Sockets of open connections; entries vanish once a connection is closed and collected
+        self._streams: "weakref.WeakSet[Any]" = weakref.WeakSet()
+        self.metrics = {"requests": 0, "errors": 0, "connections_opened": 0,
+                        "connections_reused": 0, "clients_created": 0, "total_seconds": 0.0}
+
+    def on_startup(self, hook: Hook) -> Hook:
+        """Register a coroutine to run after the client is created (usable as a decorator)"""
+        self._startup_hooks.append(hook)
+        return hook
+
+    def on_shutdown(self, hook: Hook) -> Hook:
+        """Register a coroutine to run before the client is closed (usable as a decorator)"""
+        self._shutdown_hooks.append(hook)
+        return hook
+
+    async def __aenter__(self) -> "OllamaClientManager":
+        await self.startup()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback) -> None:
+        await self.shutdown()
+
+    async def _on_request(self, request: httpx.Request) -> None:
+        # Kept on the request itself, so requests that never get a response leave nothing behind
+        request.extensions["ollama_started"] = time.perf_counter()
+
+    async def _on_response(self, response: httpx.Response) -> None:
+        started = response.request.extensions.get("ollama_started")
+        self.metrics["requests"] += 1
+        if started is not None:
+            self.metrics["total_seconds"] += time.perf_counter() - started
+        if response.is_error:
+            self.metrics["errors"] += 1
+        # httpcore exposes the underlying socket stream; seeing the same one
+        # again means the request went out on a kept-alive connection
+        stream = response.extensions.get("network_stream")
+        if stream is not None:
+            if stream in self._streams:
+                self.metrics["connections_reused"] += 1
+            else:
+                self._streams.add(stream)
+                self.metrics["connections_opened"] += 1
+
+    def _loop_changed(self) -> bool:
+        return self._loop is not asyncio.get_running_loop()
+
+    async def startup(self) -> httpx.AsyncClient:
+        """Create the shared client for the running event loop and run startup hooks"""
+        if self._client is not None and not self._loop_changed():
+            return self._client
+        if self._lock is None or self._loop_changed():
+            self._lock = asyncio.Lock()
+            # A client from a finished loop cannot be closed from this one
+            self._client = None
+            self._streams.clear()
+        async with self._lock:
+            if self._client is None:
+                self._loop = asyncio.get_running_loop()
+                self._client = httpx.AsyncClient(
+                    base_url=self.base_url,
+                    timeout=self.timeout,
+                    limits=self.limits,
+                    transport=self.transport,
+                    event_hooks={"request": [self._on_request], "response": [self._on_response]},
+                )
+                self.metrics["clients_created"] += 1
+                for hook in self._startup_hooks:
+                    await hook(self)
+        return self._client
+
+    async def client(self) -> httpx.AsyncClient:
+        """Return the shared client, creating it on first use"""
+        return await self.startup()
+
+    async def shutdown(self) -> None:
+        """Run shutdown hooks and close the shared client's connections"""
+        if self._client is None:
+            return
+        if self._loop_changed():
+            self._client = None
+            return
+        for hook in self._shutdown_hooks:
+            await hook(self)
+        client, self._client = self._client, None
+        await client.aclose()
+        self._streams.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Request counts, mean latency and the share of requests on reused connections"""
+        requests = self.metrics["requests"]
+        connections = self.metrics["connections_opened"] + self.metrics["connections_reused"]
+        return {
+            **self.metrics,
+            "mean_seconds": self.metrics["total_seconds"] / requests if requests else 0.0,
+            "reuse_ratio": self.metrics["connections_reused"] / connections if connections else 0.0,
+        }
+
+_manager: Optional[OllamaClientManager] = None
+
+def get_manager(**config: Any) -> OllamaClientManager:
+    """Return the process-wide manager, creating it with config on first call"""
+    global _manager
+    if _manager is None:
+        _manager = OllamaClientManager(**config)
+    elif config:
+        raise RuntimeError("Ollama client manager is already configured")
+    return _manager
+
+async def shutdown_manager() -> None:
+    """Close the process-wide client, if one was created"""
+    if _manager is not None:
+        await _manager.shutdown()
+
+class GenerateResponse(BaseModel):
+    """Result of /api/generate; durations are in nanoseconds as reported by Ollama"""
+    model: str = ""
+    response: str = ""
+    done: bool = True
+    done_reason: Optional[str] = None
+    context: Optional[List[int]] = None
+    total_duration: Optional[int] = None
+    load_duration: Optional[int] = None
+    prompt_eval_count: Optional[int] = None
+    prompt_eval_duration: Optional[int] = None
+    eval_count: Optional[int] = None
+    eval_duration: Optional[int] = None
+    cached: bool = False
+
+class ChatMessage(BaseModel):
+    """One turn of a chat conversation"""
+    role: str
+    content: str = ""
+
+class ChatResponse(BaseModel):
+    """Result of /api/chat; message holds the full assistant reply"""
+    model: str = ""
+    message: ChatMessage = Field(default_factory=lambda: ChatMessage(role="assistant"))
+    done: bool = True
+    done_reason: Optional[str] = None
+    total_duration: Optional[int] = None
+    load_duration: Optional[int] = None
+    prompt_eval_count: Optional[int] = None
+    eval_count: Optional[int] = None
+    eval_duration: Optional[int] = None
+
+class EmbeddingsResponse(BaseModel):
+    """Result of /api/embed, one vector per input"""
+    model: str = ""
+    embeddings: List[List[float]] = Field(default_factory=list)
+
+class ModelInfo(BaseModel):
+    """A locally available model as listed by /api/tags"""
+    name: str
+    model: Optional[str] = None
+    size: Optional[int] = None
+    digest: Optional[str] = None
+    modified_at: Optional[str] = None
+
+class TagsResponse(BaseModel):
+    """Result of /api/tags"""
+    models: List[ModelInfo] = Field(default_factory=list)
+
+    def has_model(self, prefix: str) -> bool:
+        """Whether any local model name starts with prefix, e.g. "mistral" """
+        return any(model.name.startswith(prefix) for model in self.models)
+
+async def iter_ndjson(response: httpx.Response) -> AsyncIterator[Dict[str, Any]]:
+    """Decode newline-delimited JSON objects from a streamed response as bytes arrive
+
+    Works on raw bytes: json.loads accepts them directly, so no text decode
+    or line splitting pass over the whole body is needed, and a partial line
+    at the end of a chunk waits in the buffer for the next one.
+    """
+    buffer = bytearray()
+    async for chunk in response.aiter_bytes():
+        buffer += chunk
+        start = 0
+        while True:
+            newline = buffer.find(b"\n", start)
+            if newline < 0:
+                break
+            if newline > start:
+                yield json.loads(buffer[start:newline])
+            start = newline + 1
+        del buffer[:start]
+    if buffer.strip():
+        yield json.loads(buffer)
+
+class OllamaClient:
+    """Typed async API over the shared connection pool for every Ollama endpoint the project uses
+
+    Streaming endpoints are consumed incrementally; *_stream methods yield
+    tokens as they arrive and the non-streaming methods aggregate the same
+    stream into a typed response. Errors surface as httpx.HTTPStatusError for
+    bad statuses and OllamaStreamError for errors reported inside a stream.
+
+    With a ResponseCache attached, generate() and generate_stream() serve
+    repeated (model, prompt, options) requests from the cache; pass
+    use_cache=False to bypass it or refresh=True to regenerate and overwrite.
+    """
+    def __init__(self, manager: Optional[OllamaClientManager] = None,
+                 cache: Optional[ResponseCache] = None):
+        self.manager = manager or get_manager()
+        self.cache = cache
+
+    @property
+    def base_url(self) -> str:
+        return self.manager.base_url
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self.manager.stats()
+        if self.cache is not None:
+            stats["cache"] = self.cache.stats()
+        return stats
+
+    @staticmethod
+    def _cache_options(options: Optional[Dict[str, Any]], params: Dict[str, Any]) -> Dict[str, Any]:
+        """Everything besides model and prompt that changes the output, for the cache key"""
+        extra = {key: value for key, value in params.items() if value is not None and key != "keep_alive"}
+        return {**(options or {}), **({"_params": extra} if extra else {})}
+
+    async def _cached(self, model: str, prompt: str, options: Dict[str, Any],
+                      use_cache: bool, refresh: bool) -> Optional[str]:
+        if self.cache is None or not use_cache or refresh:
+            return None
+        # SQLite lookups are blocking, so keep them off the event loop
+        return await asyncio.to_thread(self.cache.get, model, prompt, options)
+
+    async def _store(self, model: str, prompt: str, options: Dict[str, Any], response: str,
+                     use_cache: bool) -> None:
+        if self.cache is not None and use_cache:
+            await asyncio.to_thread(self.cache.put, model, prompt, options, response)
+
+    async def _stream(self, path: str, payload: Dict[str, Any],
+                      timeout: Optional[httpx.Timeout] = None) -> AsyncIterator[Dict[str, Any]]:
+        """POST payload and yield each NDJSON object of the streamed reply"""
+        client = await self.manager.client()
+        async with client.stream("POST", path, json=payload,
+                                 timeout=timeout or self.manager.timeout) as response:
+            if response.is_error:
+                await response.aread()
+                response.raise_for_status()
+            # Read through to the end of the body even after "done" so the
+            # connection goes back to the pool instead of being dropped
+            async for data in iter_ndjson(response):
+                if "error" in data:
+                    raise OllamaStreamError(data["error"])
+                yield data
+
+    async def _request(self, method: str, path: str, timeout: Optional[httpx.Timeout] = None,
+                       **kwargs: Any) -> Dict[str, Any]:
+        client = await self.manager.client()
+        response = await client.request(method, path, timeout=timeout or self.manager.timeout, **kwargs)
+        response.raise_for_status()
+        return response.json()
+
+    @staticmethod
+    def _payload(model: str, options: Optional[Dict[str, Any]], **params: Any) -> Dict[str, Any]:
+        payload = {"model": model, "stream": True,
+                   **{key: value for key, value in params.items() if value is not None}}
+        if options:
+            payload["options"] = options
+        return payload
+
+    async def generate_stream(self, model: str, prompt: str, options: Optional[Dict[str, Any]] = None,
+                              timeout: Optional[httpx.Timeout] = None, use_cache: bool = True,
+                              refresh: bool = False, **params: Any) -> AsyncIterator[str]:
+        """Yield /api/generate response tokens as Ollama produces them
+
+        A cached response is yielded as a single token.
+        """
+        cache_options = self._cache_options(options, params)
+        cached = await self._cached(model, prompt, cache_options, use_cache, refresh)
+        if cached is not None:
+            yield cached
+            return
+        parts: List[str] = []
+        async for data in self._stream("/api/generate", self._payload(model, options, prompt=prompt, **params),
+                                       timeout):
+            if data.get("response"):
+                parts.append(data["response"])
+                yield data["response"]
+        await self._store(model, prompt, cache_options, "".join(parts), use_cache)
+
+    async def generate(self, model: str, prompt: str, options: Optional[Dict[str, Any]] = None,
+                       timeout: Optional[httpx.Timeout] = None,
+                       on_token: Optional[Callable[[str], Any]] = None, use_cache: bool = True,
+                       refresh: bool = False, **params: Any) -> GenerateResponse:
+        """Run /api/generate to completion, calling on_token with each token as it arrives"""
+        cache_options = self._cache_options(options, params)
+        cached = await self._cached(model, prompt, cache_options, use_cache, refresh)
+        if cached is not None:
+            await _notify(on_token, cached)
+            return GenerateResponse(model=model, response=cached, cached=True)
+        parts: List[str] = []
+        final: Dict[str, Any] = {}
+        async for data in self._stream("/api/generate", self._payload(model, options, prompt=prompt, **params),
+                                       timeout):
+            token = data.get("response")
+            if token:
+                parts.append(token)
+                await _notify(on_token, token)
+            if data.get("done"):
+                final = data
+        response = GenerateResponse(**{"model": model, **final, "response": "".join(parts)})
+        await self._store(model, prompt, cache_options, response.response, use_cache)
+        return response
+
+    async def chat_stream(self, model: str, messages: List[Union[ChatMessage, Dict[str, str]]],
+                          options: Optional[Dict[str, Any]] = None,
+                          timeout: Optional[httpx.Timeout] = None,
+                          **params: Any) -> AsyncIterator[str]:
+        """Yield /api/chat reply tokens as Ollama produces them"""
+        payload = self._payload(model, options, messages=_chat_messages(messages), **params)
+        async for data in self._stream("/api/chat", payload, timeout):
+            token = data.get("message", {}).get("content")
+            if token:
+                yield token
+
+    async def chat(self, model: str, messages: List[Union[ChatMessage, Dict[str, str]]],
+                   options: Optional[Dict[str, Any]] = None,
+                   timeout: Optional[httpx.Timeout] = None,
+                   on_token: Optional[Callable[[str], Any]] = None,
+                   **params: Any) -> ChatResponse:
+        """Run /api/chat to completion, calling on_token with each token as it arrives"""
+        payload = self._payload(model, options, messages=_chat_messages(messages), **params)
+        parts: List[str] = []
+        final: Dict[str, Any] = {}
+        role = "assistant"
+        async for data in self._stream("/api/chat", payload, timeout):
+            message = data.get("message") or {}
+            role = message.get("role", role)
+            if message.get("content"):
+                parts.append(message["content"])
+                await _notify(on_token, message["content"])
+            if data.get("done"):
+                final = data
+        return ChatResponse(**{"model": model, **final,
+                               "message": ChatMessage(role=role, content="".join(parts))})
+
+    async def embed(self, model: str, input: Union[str, List[str]],
+                    timeout: Optional[httpx.Timeout] = None, **params: Any) -> EmbeddingsResponse:
+        """Embed one text or a batch of texts with /api/embed"""
+        data = await self._request("POST", "/api/embed", timeout,
+                                   json={"model": model, "input": input, **params})
+        return EmbeddingsResponse(**data)
+
+    async def tags(self, timeout: Optional[httpx.Timeout] = None) -> TagsResponse:
+        """List the models available locally"""
+        return TagsResponse(**await self._request("GET", "/api/tags", timeout))
+
+    async def warm_up(self, model: str, keep_alive: Union[str, int] = "10m",
+                      timeout: Optional[httpx.Timeout] = None) -> GenerateResponse:
+        """Load a model into memory ahead of the first real request
+
+        An empty prompt makes Ollama load the model and return immediately;
+        keep_alive controls how long it stays resident afterwards.
+        """
+        data = await self._request("POST", "/api/generate", timeout,
+                                   json={"model": model, "prompt": "", "stream": False,
+                                         "keep_alive": keep_alive})
+        return GenerateResponse(**data)
+
+def _chat_messages(messages: List[Union[ChatMessage, Dict[str, str]]]) -> List[Dict[str, str]]:
+    return [{"role": message.role, "content": message.content} if isinstance(message, ChatMessage)
+            else message for message in messages]
+
+async def _notify(callback: Optional[Callable[[str], Any]], token: str) -> None:
+    if callback is not None:
+        result = callback(token)
+        if asyncio.iscoroutine(result):
+            await result
+
+async def collect(tokens: AsyncIterator[str],
+                  on_token: Optional[Callable[[str], Any]] = None) -> str:
+    """Join a token stream into one string, calling on_token with each token as it arrives"""
+    parts: List[str] = []
+    async for token in tokens:
+        parts.append(token)
+        await _notify(on_token, token)
+    return "".join(parts)
@@ -0,0 +1,210 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+class ResponseCache:
+    """Two-tier cache of generated responses keyed on (model, prompt, options)
+
+    Lookups check an in-memory LRU first and then a SQLite table, promoting
+    disk hits into memory. Entries expire after ttl seconds; the disk tier is
+    trimmed to max_rows least recently used entries. With deterministic_only,
+    requests that sample (temperature above zero without a fixed seed) are
+    never cached, since repeating them is expected to give a new answer.
+    """
+    def __init__(self, db_path: Optional[str] = "db/response_cache.db", max_entries: int = 1024,
+                 max_rows: int = 100000, ttl: Optional[float] = 7 * 24 * 3600,
+                 deterministic_only: bool = False):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.max_rows = max_rows
+        self.ttl = ttl
+        self.deterministic_only = deterministic_only
+        self._memory: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._puts_since_trim = 0
+        self.metrics = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "bypassed": 0,
+                        "stores": 0, "evictions": 0, "expired": 0}
+        self._conn: Optional[sqlite3.Connection] = None
+        if db_path is not None:
+            os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(db_path, check_same_thread=False)
+            self._conn.executescript("""
+                PRAGMA journal_mode = WAL;
+                PRAGMA synchronous = NORMAL;
+                CREATE TABLE IF NOT EXISTS response_cache (
+                    key TEXT PRIMARY KEY,
+                    model TEXT NOT NULL,
+                    prompt TEXT NOT NULL,
+                    options TEXT,
+                    response TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_used REAL NOT NULL,
+                    hits INTEGER DEFAULT 0
+                );
+                CREATE INDEX IF NOT EXISTS idx_response_cache_last_used
+                    ON response_cache(last_used);
+            """)
+
+    def __enter__(self) -> "ResponseCache":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    @staticmethod
+    def key(model: str, prompt: str, options: Optional[Dict[str, Any]] = None) -> str:
+        """Stable digest of a request; option order does not matter"""
+        material = json.dumps([model, prompt, options or {}], sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def cacheable(self, options: Optional[Dict[str, Any]] = None) -> bool:
+        """Whether responses generated with these options may be cached"""
+        if not self.deterministic_only:
+            return True
+        options = options or {}
+        # Ollama samples at temperature 0.8 unless told otherwise
+        return options.get("temperature", 0.8) == 0 or options.get("seed") is not None
+
+    def _expired(self, created_at: float, now: float) -> bool:
+        return self.ttl is not None and now - created_at > self.ttl
+
+    def get(self, model: str, prompt: str, options: Optional[Dict[str, Any]] = None) -> Optional[str]:
+        """Return the cached response for a request, or None on a miss"""
+        if not self.cacheable(options):
+            with self._lock:
+                self.metrics["bypassed"] += 1
+            return None
+        key = self.key(model, prompt, options)
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if not self._expired(entry[1], now):
+                    self._memory.move_to_end(key)
+                    self.metrics["memory_hits"] += 1
+                    return entry[0]
+                del self._memory[key]
+                self.metrics["expired"] += 1
+            if self._conn is None:
+                self.metrics["misses"] += 1
+                return None
+            try:
+                row = self._conn.execute(
+                    "SELECT response, created_at FROM response_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and self._expired(row[1], now):
+                    with self._conn:
+                        self._conn.execute("DELETE FROM response_cache WHERE key = ?", (key,))
+                    self.metrics["expired"] += 1
+                    row = None
+                if row is None:
+                    self.metrics["misses"] += 1
+                    return None
+                with self._conn:
+                    self._conn.execute(
+                        "UPDATE response_cache SET last_used = ?, hits = hits + 1 WHERE key = ?",
+                        (now, key))
+            except sqlite3.Error as e:
+                print(f"Response cache error: {e}")
+                self.metrics["misses"] += 1
+                return None
+            self.metrics["disk_hits"] += 1
+            self._remember(key, row[0], row[1])
+            return row[0]
+
+    def put(self, model: str, prompt: str, options: Optional[Dict[str, Any]], response: str) -> bool:
+        """Cache a response in both tiers; returns False if the request is not cacheable"""
+        if not self.cacheable(options):
+            return False
+        key = self.key(model, prompt, options)
+        now = time.time()
+        with self._lock:
+            self._remember(key, response, now)
+            self.metrics["stores"] += 1
+            if self._conn is None:
+                return True
+            try:
+                with self._conn:
+                    self._conn.execute("""
+                        INSERT OR REPLACE INTO response_cache
+                            (key, model, prompt, options, response, created_at, last_used)
+                        VALUES (?, ?, ?, ?, ?, ?, ?)
+                    """, (key, model, prompt, json.dumps(options or {}, sort_keys=True), response, now, now))
+                self._puts_since_trim += 1
+                # Trimming costs a count over the table, so only do it now and then
+                if self._puts_since_trim >= max(1, self.max_rows // 100):
+                    self._puts_since_trim = 0
+                    self._trim_disk(now)
+            except sqlite3.Error as e:
+                print(f"Response cache error: {e}")
+        return True
+
+    def _remember(self, key: str, response: str, created_at: float) -> None:
+        """Add to the memory tier, evicting least recently used entries; caller holds the lock"""
+        self._memory[key] = (response, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.metrics["evictions"] += 1
+
+    def _trim_disk(self, now: float) -> None:
+        """Drop expired rows, then the least recently used rows beyond max_rows"""
+        with self._conn:
+            if self.ttl is not None:
+                expired = self._conn.execute(
+                    "DELETE FROM response_cache WHERE created_at < ?", (now - self.ttl,)).rowcount
+                self.metrics["expired"] += expired
+            excess = self._conn.execute("SELECT COUNT(*) FROM response_cache").fetchone()[0] - self.max_rows
+            if excess > 0:
+                self._conn.execute("""
+                    DELETE FROM response_cache WHERE key IN (
+                        SELECT key FROM response_cache ORDER BY last_used LIMIT ?
+                    )
+                """, (excess,))
+                self.metrics["evictions"] += excess
+
+    def clear(self) -> None:
+        """Remove every entry from both tiers"""
+        with self._lock:
+            self._memory.clear()
+            if self._conn is not None:
+                with self._conn:
+                    self._conn.execute("DELETE FROM response_cache")
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters, hit rate and tier sizes"""
+        with self._lock:
+            hits = self.metrics["memory_hits"] + self.metrics["disk_hits"]
+            lookups = hits + self.metrics["misses"]
+            disk_rows = None
+            if self._conn is not None:
+                disk_rows = self._conn.execute("SELECT COUNT(*) FROM response_cache").fetchone()[0]
+            return {
+                **self.metrics,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "memory_entries": len(self._memory),
+                "disk_rows": disk_rows,
+            }
+
+    def close(self) -> None:
+        """Close the SQLite connection"""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+_default_cache: Optional[ResponseCache] = None
+
+def get_response_cache(**config: Any) -> ResponseCache:
+    """Return the process-wide response cache, creating it with config on first call"""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = ResponseCache(**config)
+    elif config:
+        raise RuntimeError("Response cache is already configured")
+    return _default_cache
@@ -0,0 +1,206 @@
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+# The semantic cache is optional; SemanticCache() reports what is missing
+try:
+    import faiss
+    import numpy as np
+except ImportError:
+    faiss = None
+    np = None
+
+try:
+    from sentence_transformers import SentenceTransformer
+except ImportError:  # Not needed when an encoder is passed in
+    SentenceTransformer = None
+
+class SemanticCache:
+    """Answer cache that also matches paraphrased questions by embedding similarity
+
+    Questions are embedded with sentence-transformers and normalized, so the
+    inner-product FAISS index scores cosine similarity. Each model gets its
+    own index, so an answer is only ever reused for the model that wrote it.
+    A lookup returns the stored answer of the closest past question when its
+    similarity is at least threshold. Beyond max_entries the least recently
+    used entries are evicted, and everything persists to one file at
+    index_path + ".npz".
+    """
+    FORMAT_VERSION = 2
+
+    def __init__(self, index_path: Optional[str] = "db/semantic_cache",
+                 model_name: str = "all-MiniLM-L6-v2", threshold: float = 0.9,
+                 max_entries: int = 10000, ttl: Optional[float] = None,
+                 autosave_every: int = 50, encoder: Optional[Any] = None):
+        if faiss is None or np is None or (encoder is None and SentenceTransformer is None):
+            raise ImportError("SemanticCache requires faiss-cpu, numpy and sentence-transformers")
+        self.index_path = index_path
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.autosave_every = autosave_every
+        self.encoder = encoder or SentenceTransformer(model_name)
+        self.dimension = self.encoder.get_sentence_embedding_dimension()
+        self._lock = threading.Lock()
+        self._indexes: Dict[str, Any] = {}
+        self._entries: Dict[int, Dict[str, Any]] = {}
+        self._next_id = 0
+        self._unsaved = 0
+        self.metrics = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "expired": 0}
+        if self.path is not None and os.path.exists(self.path):
+            self._load()
+
+    @property
+    def path(self) -> Optional[str]:
+        return None if self.index_path is None else self.index_path + ".npz"
+
+    def __enter__(self) -> "SemanticCache":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def _embed(self, texts: List[str]) -> "np.ndarray":
+        vectors = self.encoder.encode(texts, convert_to_numpy=True, normalize_embeddings=True)
+        return np.ascontiguousarray(vectors, dtype="float32").reshape(len(texts), self.dimension)
+
+    def _new_index(self) -> Any:
+        return faiss.IndexIDMap2(faiss.IndexFlatIP(self.dimension))
+
+    def _expired(self, entry: Dict[str, Any], now: float) -> bool:
+        return self.ttl is not None and now - entry["created_at"] > self.ttl
+
+    def lookup(self, question: str, model: str) -> Optional[Tuple[str, float, str]]:
+        """Return (answer, similarity, matched question) for the closest match from model above threshold"""
+        vector = self._embed([question])  # Encode outside the lock; it is the slow part
+        now = time.time()
+        with self._lock:
+            index = self._indexes.get(model)
+            if index is None or index.ntotal == 0:
+                self.metrics["misses"] += 1
+                return None
+            scores, ids = index.search(vector, 1)
+            score, entry_id = float(scores[0][0]), int(ids[0][0])
+            entry = self._entries.get(entry_id)
+            if entry is not None and self._expired(entry, now):
+                self._remove([entry_id])
+                self.metrics["expired"] += 1
+                entry = None
+            if entry is None or score < self.threshold:
+                self.metrics["misses"] += 1
+                return None
+            entry["last_used"] = now
+            entry["hits"] += 1
+            self.metrics["hits"] += 1
+            return entry["answer"], score, entry["question"]
+
+    def add(self, question: str, answer: str, model: str) -> int:
+        """Store model's answer to a question and return its entry id"""
+        vector = self._embed([question])
+        now = time.time()
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            index = self._indexes.get(model)
+            if index is None:
+                index = self._indexes[model] = self._new_index()
+            index.add_with_ids(vector, np.array([entry_id], dtype="int64"))
+            self._entries[entry_id] = {"question": question, "answer": answer, "model": model,
+                                       "created_at": now, "last_used": now, "hits": 0}
+            self.metrics["stores"] += 1
+            if len(self._entries) > self.max_entries:
+                self._evict()
+            self._unsaved += 1
+            if self.index_path is not None and self._unsaved >= self.autosave_every:
+                self._save()
+            return entry_id
+
+    def _remove(self, entry_ids: List[int]) -> None:
+        """Drop entries from their model's index and the metadata; caller holds the lock"""
+        by_model: Dict[str, List[int]] = {}
+        for entry_id in entry_ids:
+            entry = self._entries.pop(entry_id, None)
+            if entry is not None:
+                by_model.setdefault(entry["model"], []).append(entry_id)
+        for model, ids in by_model.items():
+            index = self._indexes[model]
+            index.remove_ids(np.array(ids, dtype="int64"))
+            if index.ntotal == 0:
+                del self._indexes[model]
+
+    def _evict(self) -> None:
+        """Remove expired entries, then least recently used ones down to 90% of max_entries"""
+        now = time.time()
+        expired = [entry_id for entry_id, entry in self._entries.items() if self._expired(entry, now)]
+        if expired:
+            self._remove(expired)
+            self.metrics["expired"] += len(expired)
+        # Evicting a batch at once keeps the O(n) remove_ids off every insert
+        excess = len(self._entries) - int(self.max_entries * 0.9)
+        if excess > 0:
+            oldest = sorted(self._entries, key=lambda entry_id: self._entries[entry_id]["last_used"])
+            self._remove(oldest[:excess])
+            self.metrics["evictions"] += excess
+
+    def _save(self) -> None:
+        """Write every index and the metadata to one file, replaced atomically; caller holds the lock"""
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        models = sorted(self._indexes)
+        meta = {"version": self.FORMAT_VERSION, "dimension": self.dimension, "next_id": self._next_id,
+                "models": models,
+                "entries": {str(entry_id): entry for entry_id, entry in self._entries.items()}}
+        arrays = {f"index_{i}": faiss.serialize_index(self._indexes[model]) for i, model in enumerate(models)}
+        arrays["meta"] = np.frombuffer(json.dumps(meta).encode("utf-8"), dtype="uint8")
+        temporary = self.path + ".tmp"
+        with open(temporary, "wb") as handle:  # A file object stops numpy appending ".npz"
+            np.savez(handle, **arrays)
+        os.replace(temporary, self.path)
+        self._unsaved = 0
+
+    def _load(self) -> None:
+        """Restore a saved cache, starting empty if the file is unreadable or from another encoder"""
+        try:
+            with np.load(self.path) as data:
+                meta = json.loads(data["meta"].tobytes().decode("utf-8"))
+                if meta.get("version") != self.FORMAT_VERSION or meta["dimension"] != self.dimension:
+                    print(f"Ignoring semantic cache at {self.path}: different format or encoder")
+                    return
+                indexes = {model: faiss.deserialize_index(data[f"index_{i}"])
+                           for i, model in enumerate(meta["models"])}
+        except (OSError, ValueError, KeyError, RuntimeError) as e:
+            print(f"Ignoring unreadable semantic cache at {self.path}: {e}")
+            return
+        self._indexes = indexes
+        self._next_id = meta["next_id"]
+        self._entries = {int(entry_id): entry for entry_id, entry in meta["entries"].items()}
+
+    def save(self) -> None:
+        """Persist the indexes and metadata to index_path + ".npz" """
+        if self.index_path is None:
+            return
+        with self._lock:
+            self._save()
+
+    def clear(self) -> None:
+        """Remove every entry, in memory and on disk"""
+        with self._lock:
+            self._indexes.clear()
+            self._entries.clear()
+            self._unsaved = 0
+            if self.path is not None and os.path.exists(self.path):
+                os.remove(self.path)
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters, hit rate and current size"""
+        with self._lock:
+            lookups = self.metrics["hits"] + self.metrics["misses"]
+            return {**self.metrics, "hit_rate": self.metrics["hits"] / lookups if lookups else 0.0,
+                    "entries": len(self._entries), "models": len(self._indexes),
+                    "threshold": self.threshold}
+
+    def close(self) -> None:
+        """Save any unsaved entries"""
+        if self._unsaved:
+            self.save()
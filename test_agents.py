@@ -1,10 +1,11 @@
 import httpx
 import asyncio
-import json
 from datetime import datetime
-from typing import Optional, Dict, List, Any
+from typing import AsyncIterator, Callable, Optional, Dict, List, Any
 from pydantic import BaseModel, Field
 from queue import Queue
+from ollama_client import OllamaClient, OllamaStreamError, shutdown_manager
+from response_cache import get_response_cache
 
 class Message(BaseModel):
     """Standard message format for inter-agent communication"""
@@ -32,12 +33,23 @@ class QueueFullError(AgentError):
 
 class BaseAgent:
     """Base class for all agents with messaging capabilities"""
-    def __init__(self, agent_id: str, model: str = "mistral", max_queue_size: int = 100):
+    def __init__(self, agent_id: str, model: str = "mistral", max_queue_size: int = 100,
+                 db: Optional[Any] = None, ollama: Optional[OllamaClient] = None,
+                 heartbeat: Optional[Any] = None):
         self.agent_id = agent_id
         self.model = model
         self.message_queue = Queue(maxsize=max_queue_size)
-        self.base_url = "http://localhost:11434"
+        # Uses the shared pooled HTTP client and the shared response cache (db/response_cache.db)
+        self.ollama = ollama or OllamaClient(cache=get_response_cache())
+        self.base_url = self.ollama.base_url
         self.timeout = httpx.Timeout(30.0)
+        self.db = db  # Optional AsyncDatabaseManager used to persist messages
+        self.heartbeat = heartbeat  # Optional HeartbeatTracker recording last_active
+
+    def touch(self) -> None:
+        """Mark this agent active; the tracker batches the last_active writes"""
+        if self.heartbeat is not None:
+            self.heartbeat.touch(self.agent_id)
 
     async def send_message(self, to_agent_id: str, content: str, message_type: str = "general") -> Message:
         """Send a message to another agent"""
@@ -49,6 +61,7 @@ class BaseAgent:
                 message_type=message_type
             )
             print(f"Agent {self.agent_id} sending message to {to_agent_id}: {content}")
+            self.touch()
             return message
         except Exception as e:
             raise CommunicationError(f"Failed to send message: {str(e)}")
@@ -63,8 +76,48 @@ class BaseAgent:
             raise QueueFullError(f"Message queue full for agent {self.agent_id}")
             
         self.message_queue.put_nowait(message)  # Use put_nowait instead of put
+        self.touch()
         print(f"Agent {self.agent_id} received message: {message.content}")
 
+    async def persist_message(self, message: Message):
+        """Store a message through the async database layer, if one is attached"""
+        if self.db is not None:
+            await self.db.store_message(
+                message.sender_id,
+                message.receiver_id,
+                message.content,
+                message.message_type
+            )
+
+    async def stream_generate(self, prompt: str) -> AsyncIterator[str]:
+        """Stream tokens for a prompt from this agent's model"""
+        try:
+            async for token in self.ollama.generate_stream(self.model, prompt, timeout=self.timeout):
+                yield token
+        except (httpx.HTTPError, OllamaStreamError) as e:
+            raise OllamaError(f"Generation failed for agent {self.agent_id}: {str(e)}")
+
+    async def generate(self, prompt: str, on_token: Optional[Callable[[str], Any]] = None,
+                       use_cache: bool = True) -> str:
+        """Generate a full response for a prompt, calling on_token as tokens arrive
+
+        Served from the client's response cache, if it has one, unless
+        use_cache is False.
+        """
+        try:
+            response = await self.ollama.generate(self.model, prompt, timeout=self.timeout,
+                                                  on_token=on_token, use_cache=use_cache)
+        except (httpx.HTTPError, OllamaStreamError) as e:
+            raise OllamaError(f"Generation failed for agent {self.agent_id}: {str(e)}")
+        return response.response.strip()
+
+    async def warm_up(self) -> None:
+        """Load this agent's model ahead of its first request"""
+        try:
+            await self.ollama.warm_up(self.model)
+        except httpx.HTTPError as e:
+            raise OllamaError(f"Failed to load model {self.model}: {str(e)}")
+
     async def process_messages(self):
         """Process messages in the queue"""
         while not self.message_queue.empty():
@@ -77,27 +130,16 @@ class BaseAgent:
 
 class QuestionAgent(BaseAgent):
     """Agent that generates questions on topics"""
-    async def generate_question(self, topic: str) -> Message:
+    PROMPT = "Generate a thought-provoking question about: {topic}"
+
+    def stream_question(self, topic: str) -> AsyncIterator[str]:
+        """Stream the tokens of a question about a topic as they are generated"""
+        return self.stream_generate(self.PROMPT.format(topic=topic))
+
+    async def generate_question(self, topic: str, on_token: Optional[Callable[[str], Any]] = None,
+                                use_cache: bool = True) -> Message:
         """Generate a question about a specific topic using Ollama"""
-        async with httpx.AsyncClient(timeout=self.timeout) as client:
-            prompt = f"Generate a thought-provoking question about: {topic}"
-            response = await client.post(
-                f"{self.base_url}/api/generate",
-                json={
-                    "model": self.model,
-                    "prompt": prompt
-                }
-            )
-            
-            # Process the streaming response
-            question = ""
-            for line in response.text.strip().split('\n'):
-                if line:
-                    data = json.loads(line)
-                    if 'response' in data:
-                        question += data['response']
-            
-            return question.strip()
+        return await self.generate(self.PROMPT.format(topic=topic), on_token, use_cache)
 
     async def _handle_message(self, message: Message):
         """Handle responses to our questions"""
@@ -105,36 +147,46 @@ class QuestionAgent(BaseAgent):
 
 class AnswerAgent(BaseAgent):
     """Agent that answers questions"""
-    async def generate_answer(self, question: str) -> str:
-        """Generate an answer using Ollama"""
-        async with httpx.AsyncClient(timeout=self.timeout) as client:
-            response = await client.post(
-                f"{self.base_url}/api/generate",
-                json={
-                    "model": self.model,
-                    "prompt": f"Please answer this question: {question}"
-                }
-            )
-            
-            # Process the streaming response
-            answer = ""
-            for line in response.text.strip().split('\n'):
-                if line:
-                    data = json.loads(line)
-                    if 'response' in data:
-                        answer += data['response']
-            
-            return answer.strip()
+    PROMPT = "Please answer this question: {question}"
+
+    def __init__(self, *args: Any, semantic_cache: Optional[Any] = None, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self.semantic_cache = semantic_cache  # Optional SemanticCache for paraphrased questions
+
+    def stream_answer(self, question: str) -> AsyncIterator[str]:
+        """Stream the tokens of an answer as they are generated"""
+        return self.stream_generate(self.PROMPT.format(question=question))
+
+    async def generate_answer(self, question: str, on_token: Optional[Callable[[str], Any]] = None,
+                              use_cache: bool = True) -> str:
+        """Generate an answer using Ollama, reusing the answer to a similar past question if cached"""
+        if self.semantic_cache is not None and use_cache:
+            # Embedding and searching are CPU-bound, so keep them off the event loop
+            hit = await asyncio.to_thread(self.semantic_cache.lookup, question, self.model)
+            if hit is not None:
+                answer, similarity, matched = hit
+                print(f"Agent {self.agent_id} reusing answer to '{matched}' (similarity {similarity:.2f})")
+                if on_token is not None:
+                    result = on_token(answer)
+                    if asyncio.iscoroutine(result):
+                        await result
+                return answer
+        answer = await self.generate(self.PROMPT.format(question=question), on_token, use_cache)
+        if self.semantic_cache is not None and use_cache and answer:
+            await asyncio.to_thread(self.semantic_cache.add, question, answer, self.model)
+        return answer
 
     async def _handle_message(self, message: Message):
         """Handle incoming questions by generating and sending answers"""
         if message.message_type == "question":
+            await self.persist_message(message)
             answer = await self.generate_answer(message.content)
             response_message = await self.send_message(
                 to_agent_id=message.sender_id,
                 content=answer,
                 message_type="answer"
             )
+            await self.persist_message(response_message)
             # Send the response back to the questioner
             return response_message
 
@@ -167,9 +219,13 @@ async def test_qa_agents():
     questioner = QuestionAgent("questioner")
     answerer = AnswerAgent("answerer")
     
-    # Generate a question about a topic
+    # Generate a question about a topic, printing tokens as they stream in
     print("\nGenerating question about programming...")
-    question = await questioner.generate_question("python programming")
+    question = await questioner.generate_question(
+        "python programming",
+        on_token=lambda token: print(token, end="", flush=True)
+    )
+    print()
     
     # Send the question to the answer agent
     question_message = await questioner.send_message(
@@ -181,6 +237,15 @@ async def test_qa_agents():
     # Have answerer receive and process the question
     answerer.receive_message(question_message)
     await answerer.process_messages()
+    
+    # The same request again is served from the response cache without calling Ollama
+    print("\nAsking for the same question again...")
+    repeated = await questioner.generate_question("python programming")
+    print(f"Served from cache: {repeated == question}")
+    print(f"Response cache stats: {questioner.ollama.cache.stats()}")
+
+    print(f"\nOllama client stats: {questioner.ollama.stats()}")
+    await shutdown_manager()
 
 async def test_error_handling():
     """Test error handling scenarios"""
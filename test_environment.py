@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
 import sys
+import asyncio
 import subprocess
 import json
 import os
@@ -8,6 +9,7 @@ import httpx
 from pathlib import Path
 import logging
 from typing import Dict, List, Tuple
+from ollama_client import OllamaClient, OllamaClientManager, TagsResponse
 
 # Configure logging
 logging.basicConfig(
@@ -113,31 +115,22 @@ class EnvironmentTester:
 
     def test_ollama_connectivity(self) -> None:
         """Test Ollama API connectivity"""
+        async def list_models() -> TagsResponse:
+            async with OllamaClientManager(timeout=10.0) as manager:
+                return await OllamaClient(manager).tags()
+
         try:
-            with httpx.Client(timeout=10.0) as client:
-                response = client.get("http://localhost:11434/api/tags")
+            tags = asyncio.run(list_models())
+            
+            # Verify mistral model is available
+            if not tags.has_model("mistral"):
+                logger.warning("Mistral model not found in Ollama")
                 
-                if response.status_code == 200:
-                    # Verify mistral model is available
-                    models = response.json()
-                    if "models" in models and any(model.get("name", "").startswith("mistral") for model in models["models"]):
-                        self.results["ollama"] = True
-                        logger.info("Ollama connectivity test: PASSED")
-                    else:
-                        # Try checking with ollama list format
-                        response = client.get(f"{OLLAMA_BASE_URL}/api/tags")
-                        models = response.json()
-                        if any(model.get("name", "").startswith("mistral") for model in models):
-                            self.results["ollama"] = True
-                            logger.info("Ollama connectivity test: PASSED")
-                        else:
-                            logger.warning("Mistral model not found in Ollama")
-                        
-                    self.results["ollama"] = True
-                    logger.info("Ollama connectivity test: PASSED")
-                else:
-                    logger.warning(f"Ollama API returned status code: {response.status_code}")
+            self.results["ollama"] = True
+            logger.info("Ollama connectivity test: PASSED")
                     
+        except httpx.HTTPStatusError as e:
+            logger.warning(f"Ollama API returned status code: {e.response.status_code}")
         except Exception as e:
             logger.error(f"Error connecting to Ollama: {str(e)}")
 
@@ -0,0 +1,209 @@
+import asyncio
+import gc
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, AsyncIterator, Callable, List, Optional
+
+import httpx
+
+from ollama_client import OllamaClient, OllamaClientManager, OllamaStreamError
+from response_cache import ResponseCache
+
+def mock_client(handler: Callable[[httpx.Request], Any],
+                cache: Optional[ResponseCache] = None) -> OllamaClient:
+    """OllamaClient whose requests are answered by handler instead of a server"""
+    return OllamaClient(OllamaClientManager(base_url="http://ollama.test",
+                                            transport=httpx.MockTransport(handler)), cache=cache)
+
+def streamed(*chunks: bytes) -> httpx.Response:
+    """Streamed 200 response delivering the body in exactly these chunks"""
+    async def body() -> AsyncIterator[bytes]:
+        for chunk in chunks:
+            yield chunk
+    return httpx.Response(200, content=body(), headers={"Content-Type": "application/x-ndjson"})
+
+class TagsHandler(BaseHTTPRequestHandler):
+    """Minimal keep-alive server answering /api/tags"""
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        body = json.dumps({"models": [{"name": "mistral:latest"}]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def test_connection_reuse():
+    print("Testing pooled connection reuse:")
+    server = ThreadingHTTPServer(("127.0.0.1", 0), TagsHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    manager = OllamaClientManager(base_url=f"http://127.0.0.1:{server.server_port}")
+
+    async def run():
+        client = OllamaClient(manager)
+        for _ in range(5):
+            assert (await client.tags()).has_model("mistral")
+        await manager.shutdown()
+
+    try:
+        asyncio.run(run())
+        # A new event loop gets a new client and so a new connection
+        asyncio.run(run())
+    finally:
+        server.shutdown()
+        server.server_close()
+    stats = manager.stats()
+    print(f"Manager stats: {stats}")
+    assert stats["requests"] == 10 and stats["clients_created"] == 2
+    assert stats["connections_opened"] == 2 and stats["connections_reused"] == 8
+    # Closed connections are forgotten rather than tracked forever
+    gc.collect()
+    assert len(manager._streams) == 0
+
+    # Requests that fail to connect get no response and are not counted
+    async def refused():
+        try:
+            await OllamaClient(manager).tags()
+            assert False, "Expected a connection error"
+        except httpx.ConnectError:
+            pass
+        await manager.shutdown()
+
+    asyncio.run(refused())
+    assert manager.stats()["requests"] == 10 and manager.stats()["connections_opened"] == 2
+
+def test_split_ndjson_lines():
+    print("\nTesting NDJSON lines split across chunks:")
+    # Lines break mid-object, chunks hold several lines, and the last line has no newline
+    client = mock_client(lambda request: streamed(
+        b'{"response": "Hel',
+        b'lo", "done": false}\n{"response": " wor',
+        b'ld", "done": false}\n\n{"response": "!", "done": false}\n{"done": true, ',
+        b'"eval_count": 3}'))
+    tokens: List[str] = []
+
+    async def run():
+        return await client.generate("mistral", "Say hello", on_token=tokens.append)
+
+    response = asyncio.run(run())
+    print(f"Tokens {tokens} -> {response.response!r}")
+    assert tokens == ["Hello", " world", "!"]
+    assert response.response == "Hello world!" and response.eval_count == 3
+    assert response.model == "mistral" and response.done
+
+def test_stream_error():
+    print("\nTesting an error reported mid-stream:")
+    client = mock_client(lambda request: streamed(
+        b'{"response": "partial", "done": false}\n',
+        b'{"error": "model runner crashed"}\n'))
+    tokens: List[str] = []
+
+    async def run():
+        await client.generate("mistral", "Say hello", on_token=tokens.append)
+
+    try:
+        asyncio.run(run())
+        assert False, "Expected OllamaStreamError"
+    except OllamaStreamError as e:
+        print(f"Raised as expected: {e}")
+        assert str(e) == "model runner crashed"
+    assert tokens == ["partial"]
+
+    # Bad statuses surface as HTTP errors before any token
+    client = mock_client(lambda request: httpx.Response(404, json={"error": "model not found"}))
+    try:
+        asyncio.run(run())
+        assert False, "Expected HTTPStatusError"
+    except httpx.HTTPStatusError as e:
+        assert e.response.status_code == 404
+
+def ollama_handler(requests: List[dict]) -> Callable[[httpx.Request], httpx.Response]:
+    """Fake Ollama API that records each request as {"path", "payload"}"""
+    def handle(request: httpx.Request) -> httpx.Response:
+        payload = json.loads(request.content) if request.content else None
+        requests.append({"path": request.url.path, "payload": payload})
+        if request.url.path == "/api/generate" and payload.get("stream") is False:
+            return httpx.Response(200, json={"model": payload["model"], "response": "", "done": True,
+                                             "done_reason": "load"})
+        if request.url.path == "/api/generate":
+            return streamed(b'{"model": "mistral", "response": "4", "done": false}\n'
+                            b'{"model": "mistral", "response": "", "done": true, "eval_count": 1}\n')
+        if request.url.path == "/api/chat":
+            return streamed(b'{"message": {"role": "assistant", "content": "Hi"}, "done": false}\n'
+                            b'{"message": {"role": "assistant", "content": " there"}, "done": false}\n'
+                            b'{"message": {"role": "assistant", "content": ""}, "done": true}\n')
+        if request.url.path == "/api/embed":
+            inputs = payload["input"] if isinstance(payload["input"], list) else [payload["input"]]
+            return httpx.Response(200, json={"model": payload["model"],
+                                             "embeddings": [[float(len(text)), 1.0] for text in inputs]})
+        if request.url.path == "/api/tags":
+            return httpx.Response(200, json={"models": [{"name": "mistral:latest", "size": 4}]})
+        return httpx.Response(404, json={"error": "not found"})
+    return handle
+
+def test_endpoints():
+    print("\nTesting generate/chat/embed/tags:")
+    requests: List[dict] = []
+    client = mock_client(ollama_handler(requests))
+
+    async def run():
+        answer = await client.generate("mistral", "2 + 2?", options={"temperature": 0}, system="Be brief")
+        tokens = [token async for token in client.generate_stream("mistral", "2 + 2?")]
+        chat = await client.chat("mistral", [{"role": "user", "content": "Hello"}])
+        embeddings = await client.embed("nomic-embed-text", ["a", "abc"])
+        tags = await client.tags()
+        warm = await client.warm_up("mistral", keep_alive="5m")
+        return answer, tokens, chat, embeddings, tags, warm
+
+    answer, tokens, chat, embeddings, tags, warm = asyncio.run(run())
+    print(f"generate={answer.response!r} chat={chat.message.content!r} "
+          f"embeddings={embeddings.embeddings} models={[model.name for model in tags.models]}")
+    assert answer.response == "4" and answer.eval_count == 1 and tokens == ["4"]
+    assert chat.message.role == "assistant" and chat.message.content == "Hi there"
+    assert embeddings.embeddings == [[1.0, 1.0], [3.0, 1.0]]
+    assert tags.has_model("mistral") and not tags.has_model("llama")
+    assert warm.done_reason == "load"
+
+    # Payloads: streaming on, options nested, extra params passed through
+    generate = requests[0]["payload"]
+    assert generate == {"model": "mistral", "stream": True, "prompt": "2 + 2?", "system": "Be brief",
+                        "options": {"temperature": 0}}
+    assert requests[2]["payload"]["messages"] == [{"role": "user", "content": "Hello"}]
+    assert requests[5]["payload"] == {"model": "mistral", "prompt": "", "stream": False, "keep_alive": "5m"}
+    assert [request["path"] for request in requests] == [
+        "/api/generate", "/api/generate", "/api/chat", "/api/embed", "/api/tags", "/api/generate"]
+
+def test_response_cache():
+    print("\nTesting cached generation:")
+    requests: List[dict] = []
+    client = mock_client(ollama_handler(requests), cache=ResponseCache(None))
+
+    async def run():
+        first = await client.generate("mistral", "2 + 2?")
+        second = await client.generate("mistral", "2 + 2?")
+        streamed_tokens = [token async for token in client.generate_stream("mistral", "2 + 2?")]
+        bypassed = await client.generate("mistral", "2 + 2?", use_cache=False)
+        refreshed = await client.generate("mistral", "2 + 2?", refresh=True)
+        other_options = await client.generate("mistral", "2 + 2?", options={"temperature": 0})
+        return first, second, streamed_tokens, bypassed, refreshed, other_options
+
+    first, second, streamed_tokens, bypassed, refreshed, other_options = asyncio.run(run())
+    print(f"Cache stats: {client.stats()['cache']}")
+    assert not first.cached and second.cached and second.response == first.response
+    assert streamed_tokens == ["4"]
+    assert not bypassed.cached and not refreshed.cached and not other_options.cached
+    # Only the first, the bypassed, the refreshed and the differently configured calls reach Ollama
+    assert len(requests) == 4
+
+if __name__ == "__main__":
+    test_connection_reuse()
+    test_split_ndjson_lines()
+    test_stream_error()
+    test_endpoints()
+    test_response_cache()
@@ -0,0 +1,76 @@
+import os
+import sqlite3
+import tempfile
+import time
+
+from response_cache import ResponseCache
+
+def test_memory_and_disk_tiers():
+    print("Testing memory and disk tiers:")
+    db_path = os.path.join(tempfile.mkdtemp(), "responses.db")
+    with ResponseCache(db_path, max_entries=2) as cache:
+        assert cache.get("mistral", "2 + 2?") is None
+        assert cache.put("mistral", "2 + 2?", {"temperature": 0, "seed": 1}, "4")
+        # Option order does not change the key
+        assert cache.get("mistral", "2 + 2?", {"seed": 1, "temperature": 0}) == "4"
+        # Model and prompt both belong to the key
+        assert cache.get("llama2", "2 + 2?", {"temperature": 0, "seed": 1}) is None
+        assert cache.get("mistral", "3 + 3?", {"temperature": 0, "seed": 1}) is None
+
+        cache.put("mistral", "a", None, "A")
+        cache.put("mistral", "b", None, "B")  # Evicts "2 + 2?" from memory, not from disk
+        assert cache.get("mistral", "2 + 2?", {"temperature": 0, "seed": 1}) == "4"
+        stats = cache.stats()
+        print(f"Cache stats: {stats}")
+        assert stats["memory_hits"] == 1 and stats["disk_hits"] == 1 and stats["misses"] == 3
+        assert stats["evictions"] == 2 and stats["memory_entries"] == 2 and stats["disk_rows"] == 3
+
+    # Entries survive reopening
+    with ResponseCache(db_path) as cache:
+        assert cache.get("mistral", "a") == "A"
+        assert cache.stats()["disk_hits"] == 1
+
+def test_expiry_and_trimming():
+    print("\nTesting expiry and trimming:")
+    db_path = os.path.join(tempfile.mkdtemp(), "responses.db")
+    with ResponseCache(db_path, ttl=60, max_rows=100) as cache:
+        cache.put("mistral", "old", None, "stale")
+        conn = sqlite3.connect(db_path)
+        with conn:
+            conn.execute("UPDATE response_cache SET created_at = ?", (time.time() - 120,))
+        conn.close()
+        cache._memory.clear()
+        assert cache.get("mistral", "old") is None
+        assert cache.stats()["expired"] == 1
+
+        # Every max_rows // 100 puts the disk tier is trimmed to max_rows
+        for i in range(150):
+            cache.put("mistral", f"prompt {i}", None, f"answer {i}")
+        stats = cache.stats()
+        print(f"Cache stats: {stats}")
+        assert stats["disk_rows"] == 100
+        assert cache.get("mistral", "prompt 149") == "answer 149"
+
+        cache.clear()
+        assert cache.stats()["disk_rows"] == 0 and cache.get("mistral", "prompt 149") is None
+
+def test_deterministic_only():
+    print("\nTesting deterministic_only:")
+    with ResponseCache(None, deterministic_only=True) as cache:
+        # Sampled requests are never cached
+        assert not cache.put("mistral", "poem", None, "roses")
+        assert not cache.put("mistral", "poem", {"temperature": 0.7}, "roses")
+        assert cache.get("mistral", "poem") is None
+        # Greedy or seeded requests are
+        assert cache.put("mistral", "poem", {"temperature": 0}, "violets")
+        assert cache.put("mistral", "poem", {"seed": 42}, "tulips")
+        assert cache.get("mistral", "poem", {"temperature": 0}) == "violets"
+        assert cache.get("mistral", "poem", {"seed": 42}) == "tulips"
+        stats = cache.stats()
+        print(f"Cache stats: {stats}")
+        assert stats["bypassed"] == 1 and stats["disk_rows"] is None
+
+if __name__ == "__main__":
+    test_memory_and_disk_tiers()
+    test_expiry_and_trimming()
+    test_deterministic_only()
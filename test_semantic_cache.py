@@ -0,0 +1,96 @@
+import os
+import re
+import tempfile
+import zlib
+
+import numpy as np
+
+from semantic_cache import SemanticCache
+
+class FakeEncoder:
+    """Bag-of-words stand-in for SentenceTransformer: same words, same vector"""
+    dimension = 64
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dimension
+
+    def encode(self, texts, convert_to_numpy=True, normalize_embeddings=False):
+        vectors = np.zeros((len(texts), self.dimension), dtype="float32")
+        for row, text in enumerate(texts):
+            for word in re.findall(r"\w+", text.lower()):
+                vectors[row, zlib.crc32(word.encode()) % self.dimension] += 1.0
+        if normalize_embeddings:
+            vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        return vectors
+
+def test_paraphrase_lookup():
+    print("Testing paraphrase lookup:")
+    with SemanticCache(None, encoder=FakeEncoder(), threshold=0.9) as cache:
+        cache.add("What is a Python decorator?", "A function that wraps another", "mistral")
+        hit = cache.lookup("what is a python decorator", "mistral")
+        print(f"Hit: {hit}")
+        assert hit is not None and hit[0] == "A function that wraps another" and hit[1] > 0.99
+        assert cache.lookup("How does garbage collection work?", "mistral") is None
+        stats = cache.stats()
+        assert stats["hits"] == 1 and stats["misses"] == 1
+
+def test_model_scoping():
+    print("\nTesting answers stay with their model:")
+    with SemanticCache(None, encoder=FakeEncoder()) as cache:
+        cache.add("What is a Python decorator?", "mistral's answer", "mistral")
+        assert cache.lookup("What is a Python decorator?", "llama2") is None
+        cache.add("What is a Python decorator?", "llama2's answer", "llama2")
+        assert cache.lookup("What is a Python decorator?", "mistral")[0] == "mistral's answer"
+        assert cache.lookup("What is a Python decorator?", "llama2")[0] == "llama2's answer"
+        assert cache.stats()["models"] == 2
+
+def test_eviction_and_expiry():
+    print("\nTesting eviction and expiry:")
+    with SemanticCache(None, encoder=FakeEncoder(), max_entries=10) as cache:
+        for i in range(25):
+            cache.add(f"question number {i}", f"answer {i}", "mistral" if i % 2 else "llama2")
+        stats = cache.stats()
+        print(f"Cache stats: {stats}")
+        assert stats["entries"] <= 10 and stats["evictions"] >= 15
+        assert cache.lookup("question number 24", "llama2")[0] == "answer 24"
+    with SemanticCache(None, encoder=FakeEncoder(), ttl=-1) as cache:
+        cache.add("What is a Python decorator?", "expired", "mistral")
+        assert cache.lookup("What is a Python decorator?", "mistral") is None
+        assert cache.stats()["expired"] == 1 and cache.stats()["entries"] == 0
+
+def test_persistence():
+    print("\nTesting persistence:")
+    index_path = os.path.join(tempfile.mkdtemp(), "semantic")
+    with SemanticCache(index_path, encoder=FakeEncoder(), autosave_every=2) as cache:
+        cache.add("What is a Python decorator?", "wraps functions", "mistral")
+        cache.add("What is a list comprehension?", "builds lists", "llama2")
+        # Autosaved as a single file, with no temporary file left behind
+        assert sorted(os.listdir(os.path.dirname(index_path))) == ["semantic.npz"]
+        cache.add("What is a generator?", "yields values", "mistral")
+
+    with SemanticCache(index_path, encoder=FakeEncoder()) as cache:
+        print(f"Reloaded stats: {cache.stats()}")
+        assert cache.stats()["entries"] == 3 and cache.stats()["models"] == 2
+        assert cache.lookup("what is a generator", "mistral")[0] == "yields values"
+        assert cache.lookup("what is a list comprehension", "llama2")[0] == "builds lists"
+        assert cache.add("What is a closure?", "captures variables", "mistral") == 3
+
+        cache.clear()
+        assert not os.path.exists(cache.path) and cache.stats()["entries"] == 0
+    # Nothing unsaved after clear(), so closing did not write the file back
+    assert not os.path.exists(index_path + ".npz")
+
+    # A damaged file is ignored rather than crashing startup
+    with open(index_path + ".npz", "wb") as handle:
+        handle.write(b"not a cache")
+    with SemanticCache(index_path, encoder=FakeEncoder()) as cache:
+        assert cache.stats()["entries"] == 0
+        cache.add("What is a Python decorator?", "wraps functions", "mistral")
+    with SemanticCache(index_path, encoder=FakeEncoder()) as cache:
+        assert cache.stats()["entries"] == 1
+
+if __name__ == "__main__":
+    test_paraphrase_lookup()
+    test_model_scoping()
+    test_eviction_and_expiry()
+    test_persistence()